@@ -0,0 +1,383 @@
+# allocation.py
+"""
+Allocation engine behind /api/recommendations and /api/rebalance: turns a
+budget (or an existing portfolio), the user's risk level and their saved
+constraints into integer share counts.
+
+Weights are either the original risk tilt (risk_level - risk_class + 1) or
+long-only mean-variance weights from historical returns. Shares are the
+floor of each dollar allocation, then leftover cash is spent the way the
+old one-share-per-stock-per-pass loop did, but computed pass-count at a
+time, so the work is O(n^2) in the number of positions and independent of
+the budget. Rebalancing works on whole portfolios of hundreds of positions,
+so it places the leftover shares in one vectorized pass instead.
+
+Constraints (the document stored by /api/constraints, unknown keys ignored):
+    max_positions      number of stocks to hold (default 10)
+    max_weight         largest fraction of the budget in one stock, 0-1
+    excluded_tickers   tickers never to recommend
+    sectors            only recommend stocks from these sectors
+    method             "risk" (default) or "mean_variance"
+    rebalance_band     skip rebalance trades that move a position by less
+                       than this fraction of the portfolio value (default 0)
+"""
+import os
+import numpy as np
+
+MAX_POSITIONS = 10
+# Trading days of history used for mean-variance weights
+LOOKBACK = 252
+METHODS = ("risk", "mean_variance")
+# Expected cost of a trade (commission plus half-spread), in basis points of its value
+TRADE_COST_BPS = float(os.environ.get("TRADE_COST_BPS", 10))
+
+
+def parse_constraints(constraints, max_positions=MAX_POSITIONS):
+    """
+    Validates the stored constraints document; raises ValueError with a
+    user-facing message. max_positions is the default when the document
+    does not set one (None for no limit).
+    """
+    constraints = constraints or {}
+    parsed = {
+        "max_positions": max_positions,
+        "max_weight": None,
+        "excluded_tickers": set(),
+        "sectors": None,
+        "method": "risk",
+        "rebalance_band": 0.0,
+    }
+    try:
+        if constraints.get("max_positions") not in (None, ""):
+            parsed["max_positions"] = int(constraints["max_positions"])
+        if constraints.get("max_weight") not in (None, ""):
+            parsed["max_weight"] = float(constraints["max_weight"])
+        if constraints.get("rebalance_band") not in (None, ""):
+            parsed["rebalance_band"] = float(constraints["rebalance_band"])
+    except (TypeError, ValueError):
+        raise ValueError("max_positions, max_weight and rebalance_band must be numbers.")
+    if parsed["max_positions"] is not None and parsed["max_positions"] < 1:
+        raise ValueError("max_positions must be at least 1.")
+    if parsed["max_weight"] is not None and not 0 < parsed["max_weight"] <= 1:
+        raise ValueError("max_weight must be between 0 and 1.")
+    if not 0 <= parsed["rebalance_band"] < 1:
+        raise ValueError("rebalance_band must be between 0 and 1.")
+    if constraints.get("excluded_tickers"):
+        parsed["excluded_tickers"] = {str(t).upper() for t in constraints["excluded_tickers"]}
+    if constraints.get("sectors"):
+        parsed["sectors"] = set(constraints["sectors"])
+    if constraints.get("method"):
+        if constraints["method"] not in METHODS:
+            raise ValueError(f"method must be one of {', '.join(METHODS)}.")
+        parsed["method"] = constraints["method"]
+    return parsed
+
+
+def select_stocks(stocks, constraints):
+    """Applies the exclusion/sector filters and keeps the lowest-risk max_positions stocks."""
+    candidates = [
+        stock for stock in stocks
+        if str(stock.get("Ticker", "")).upper() not in constraints["excluded_tickers"]
+        and (constraints["sectors"] is None or stock.get("sector") in constraints["sectors"])
+    ]
+    candidates.sort(key=lambda s: s["risk_class"])
+    return candidates[:constraints["max_positions"]]
+
+
+# ---------------------------
+# Weights
+# ---------------------------
+def risk_weights(risk_classes, risk_level):
+    """The original tilt towards lower risk: weight = risk_level - risk_class + 1."""
+    weights = risk_level - np.asarray(risk_classes, dtype=float) + 1
+    return weights / weights.sum()
+
+
+def weights_from_moments(mean, cov):
+    """
+    Long-only weights proportional to inverse(covariance) @ mean. A small
+    ridge keeps the covariance invertible for short or collinear histories.
+    Returns None when no stock gets a positive weight, so the caller can
+    fall back.
+    """
+    n = len(mean)
+    if n == 0:
+        return None
+    cov = np.array(cov, dtype=float)
+    cov[np.diag_indices(n)] += max(np.trace(cov) / n, 1e-12) * 1e-3
+    weights = np.clip(np.linalg.solve(cov, mean), 0, None)
+    if weights.sum() <= 0:
+        return None
+    return weights / weights.sum()
+
+
+def mean_variance_weights(returns):
+    """weights_from_moments for a (dates x stocks) matrix of daily returns."""
+    mean = returns.mean(axis=0)
+    return weights_from_moments(mean, np.cov(returns, rowvar=False).reshape(len(mean), len(mean)))
+
+
+def panel_weights(panel, tickers):
+    """
+    Mean-variance weights for tickers from the cached returns panel, or None
+    when the panel is missing or does not cover every ticker.
+    """
+    if panel is None:
+        return None
+    present, mean, cov = panel.moments(tickers)
+    if not present.all():
+        return None
+    return weights_from_moments(mean, cov)
+
+
+def load_returns(db, tickers, lookback=LOOKBACK):
+    """
+    (dates x tickers) daily returns over the last lookback bars, on the dates
+    every ticker traded. Returns None when there is not enough shared history.
+    """
+    from modelAI import history
+    closes = {
+        ticker: {bar["Date"]: bar["Close"] for bar in history.tail(db, ticker, lookback + 1, fields=("Close",))}
+        for ticker in tickers
+    }
+    dates = sorted(set.intersection(*(set(c) for c in closes.values()))) if closes else []
+    if len(dates) < 3:
+        return None
+    prices = np.array([[closes[ticker][date] for ticker in tickers] for date in dates], dtype=float)
+    return np.diff(prices, axis=0) / prices[:-1]
+
+
+def cap_weights(weights, max_weight):
+    """
+    Caps every weight at max_weight and spreads the excess over the uncapped
+    stocks in proportion to their weights. At most one pass per stock. When
+    the cap is too low to place the whole budget, the rest stays in cash.
+    """
+    weights = np.asarray(weights, dtype=float).copy()
+    capped = np.zeros(len(weights), dtype=bool)
+    for _ in range(len(weights)):
+        over = (weights > max_weight + 1e-12) & ~capped
+        if not over.any():
+            break
+        capped |= over
+        weights[capped] = max_weight
+        free = ~capped
+        room = 1.0 - weights[capped].sum()
+        if not free.any() or weights[free].sum() <= 0 or room <= 0:
+            weights[free] = np.clip(weights[free], 0, max(room, 0))
+            break
+        weights[free] *= room / weights[free].sum()
+    return weights
+
+
+# ---------------------------
+# Integer shares
+# ---------------------------
+def top_up(prices, quantities, remaining, max_quantities=None):
+    """
+    Spends remaining cash exactly like the greedy loop it replaces: repeated
+    passes over the stocks in order, buying one share of each stock that is
+    still affordable (and under its max_quantities cap). Returns
+    (quantities, remaining).
+
+    While the cash covers one share of every affordable stock, a pass buys
+    all of them, so k = remaining // sum(prices) such passes are taken at
+    once. A pass that cannot buy all of them skips a stock that then stays
+    unaffordable, and a stock that reaches its cap drops out, so the
+    affordable set shrinks after at most one partial pass: O(n) rounds of
+    O(n) work, whatever the budget.
+    """
+    prices = np.asarray(prices, dtype=float)
+    quantities = np.asarray(quantities, dtype=np.int64).copy()
+    caps = None if max_quantities is None else np.asarray(max_quantities, dtype=np.int64)
+    while remaining > 0:
+        active = (prices > 0) & (prices <= remaining)
+        if caps is not None:
+            active &= quantities < caps
+        if not active.any():
+            break
+        total = prices[active].sum()
+        passes = int(remaining // total)
+        if caps is not None:
+            passes = min(passes, int((caps[active] - quantities[active]).min()))
+        if passes > 0:
+            quantities[active] += passes
+            remaining -= passes * total
+            continue
+        # One partial pass, in stock order, as the loop did it
+        for i in np.flatnonzero(active):
+            if remaining >= prices[i]:
+                quantities[i] += 1
+                remaining -= prices[i]
+    return quantities, remaining
+
+
+def allocate(stocks, budget, risk_level, constraints=None, returns=None, weights=None):
+    """
+    stocks: selected stock documents (Ticker, risk_class, Close), in the
+    order shares are handed out. For mean_variance, either precomputed
+    weights (e.g. panel_weights) or (dates x stocks) daily returns.
+    Returns (positions, total_cost, remaining) where positions are the
+    stocks that got at least one share, each with current_price and
+    recommended_quantity set.
+    """
+    constraints = constraints or parse_constraints(None)
+    if not stocks:
+        return [], 0.0, budget
+    prices = np.array([float(s.get("Close") or 0.0) for s in stocks])
+    # A stock without a price gets no shares
+    divisor = np.where(prices > 0, prices, np.inf)
+
+    if weights is None and constraints["method"] == "mean_variance" and returns is not None:
+        weights = mean_variance_weights(returns)
+    if weights is None:
+        weights = risk_weights([s["risk_class"] for s in stocks], risk_level)
+    max_quantities = None
+    if constraints["max_weight"] is not None:
+        weights = cap_weights(weights, constraints["max_weight"])
+        max_quantities = np.floor(constraints["max_weight"] * budget / divisor).astype(np.int64)
+
+    quantities = np.floor(weights * budget / divisor).astype(np.int64)
+    if max_quantities is not None:
+        quantities = np.minimum(quantities, max_quantities)
+
+    # Only stocks that got a share from their own allocation take part in the top-up
+    held = quantities > 0
+    total_cost = float((quantities[held] * prices[held]).sum())
+    topped, remaining = top_up(
+        prices[held], quantities[held], budget - total_cost,
+        None if max_quantities is None else max_quantities[held]
+    )
+
+    positions = []
+    for stock, price, quantity in zip([s for s, h in zip(stocks, held) if h], prices[held], topped):
+        stock["current_price"] = float(price)
+        stock["recommended_quantity"] = int(quantity)
+        positions.append(stock)
+    return positions, budget - remaining, remaining
+
+
+# ---------------------------
+# Rebalance
+# ---------------------------
+def target_weights(tickers, risk_classes, sectors, constraints, risk_level=None, moments=None, tradable=None):
+    """
+    Target weight of every held ticker in holding order, and the method that
+    produced them. moments: (present, mean, cov) from
+    returns_panel.Panel.moments; mean_variance needs it to cover every
+    ticker, otherwise the risk tilt is used. Tickers that are excluded,
+    outside the allowed sectors, riskier than an explicit risk_level or not
+    tradable, and all but the max_positions largest weights, get zero;
+    max_weight caps the rest.
+    """
+    n = len(tickers)
+    risk_classes = np.asarray(risk_classes, dtype=float)
+    allowed = np.ones(n, dtype=bool) if tradable is None else np.asarray(tradable, dtype=bool).copy()
+    if risk_level is None:
+        risk_level = np.nanmax(risk_classes) if np.isfinite(risk_classes).any() else 0
+    else:
+        allowed &= ~(risk_classes > risk_level)
+    # An unscored stock is treated as the riskiest allowed
+    risk_classes = np.where(np.isnan(risk_classes), risk_level, np.minimum(risk_classes, risk_level))
+
+    if constraints["excluded_tickers"]:
+        allowed &= ~np.isin(np.char.upper(np.asarray(tickers, dtype=str)), list(constraints["excluded_tickers"]))
+    if constraints["sectors"] is not None:
+        allowed &= np.isin(np.asarray(sectors, dtype=object), list(constraints["sectors"]))
+
+    # Weights are solved over the allowed stocks only
+    weights = np.zeros(n)
+    method = "risk"
+    if not allowed.any():
+        return weights, method
+    solved = None
+    if constraints["method"] == "mean_variance" and moments is not None and moments[0].all():
+        solved = weights_from_moments(moments[1][allowed], moments[2][np.ix_(allowed, allowed)])
+        method = "mean_variance" if solved is not None else method
+    if solved is None:
+        solved = risk_weights(risk_classes[allowed], risk_level)
+    weights[allowed] = solved
+
+    if constraints["max_positions"] is not None and np.count_nonzero(weights) > constraints["max_positions"]:
+        keep = np.argsort(-weights, kind="stable")[:constraints["max_positions"]]
+        mask = np.zeros(n, dtype=bool)
+        mask[keep] = True
+        weights = np.where(mask, weights, 0.0)
+    if weights.sum() <= 0:
+        return weights, method
+    weights = weights / weights.sum()
+    if constraints["max_weight"] is not None:
+        weights = cap_weights(weights, constraints["max_weight"])
+    return weights, method
+
+
+def _whole_shares(weights, prices, budget, max_quantities=None):
+    """
+    Floors each target to whole shares, then buys one more share of the
+    stocks with the largest fractional remainders while the leftover cash
+    allows: a single vectorized pass, so it stays flat for large portfolios.
+    """
+    divisor = np.where(prices > 0, prices, np.inf)
+    exact = weights * budget / divisor
+    shares = np.floor(exact)
+    if max_quantities is not None:
+        shares = np.minimum(shares, max_quantities)
+    leftover = budget - float((shares * prices).sum())
+    eligible = (prices > 0) & (prices <= leftover) & (weights > 0)
+    if max_quantities is not None:
+        eligible &= shares < max_quantities
+    order = np.flatnonzero(eligible)
+    order = order[np.argsort(-(exact - shares)[order], kind="stable")]
+    extra = order[np.cumsum(prices[order]) <= leftover]
+    shares[extra] += 1
+    return shares.astype(np.int64)
+
+
+def rebalance(prices, shares, weights, cash=0.0, max_weight=None, band=0.0, cost_bps=TRADE_COST_BPS):
+    """
+    Whole-share trades that move a portfolio to the target weights, with no
+    per-position Python work.
+
+    prices, shares, weights: arrays in holding order. cash is added to the
+    investable value. Positions without a price are left as they are.
+    Positions whose target differs from the current value
+    by less than band * value keep their shares; the rest of the value is
+    spread over the other positions in proportion to their weights, so
+    every skipped trade is one the user does not pay for. Sells fund buys;
+    the plan never spends more than the value plus cash.
+
+    Returns a dict of arrays (target, trade) and totals (value, turnover,
+    expected_cost, cash_left).
+    """
+    prices = np.asarray(prices, dtype=float)
+    shares = np.asarray(shares, dtype=np.int64)
+    weights = np.asarray(weights, dtype=float)
+    current = prices * shares
+    value = float(current.sum()) + cash
+
+    # No-trade band: keep positions already close enough to their target
+    keep = np.abs(weights * value - current) < band * value if band > 0 else np.zeros(len(prices), dtype=bool)
+    keep |= prices <= 0
+    kept_value = float(current[keep].sum())
+    free = ~keep & (weights > 0)
+    budget = value - kept_value
+    target = np.where(keep, shares, 0)
+    if free.any() and budget > 0:
+        free_weights = np.where(free, weights, 0.0)
+        free_weights = free_weights / free_weights.sum() if free_weights.sum() > 0 else free_weights
+        max_quantities = None
+        if max_weight is not None:
+            max_quantities = np.floor(max_weight * value / np.where(prices > 0, prices, np.inf))
+        target = np.where(free, _whole_shares(free_weights, prices, budget, max_quantities), target)
+
+    trade = target - shares
+    traded_value = np.abs(trade) * prices
+    turnover = float(traded_value.sum())
+    return {
+        "target": target,
+        "trade": trade,
+        "value": value,
+        "turnover": turnover,
+        "expected_cost": turnover * cost_bps / 10000,
+        "cash_left": value - float((target * prices).sum()),
+    }
@@ -0,0 +1,101 @@
+# backfill_account_stats.py
+"""
+Backfill of users.trade_stats, the running aggregates behind /api/account:
+profit (sum of totalPrice - purchasePrice) and the number of transactions.
+trade_stats.backfilled_at marks stats that cover every transaction;
+purchase() keeps them current with $inc from then on, and new accounts
+start at zero with the marker set.
+
+    python backfill_account_stats.py [--all]
+
+By default only users without the marker are filled in, including those
+whose first purchase after the deploy already created partial stats;
+--all recomputes every user. /api/account also backfills a user without
+the marker on first read.
+
+A backfill races purchases safely without pausing them. purchase() inserts
+its transaction first and then records it with record_purchase(). The
+backfill stores trade_stats.through, the largest transaction _id it
+counted, and record_purchase() only adds a transaction that is newer than
+that watermark. A backfill write is dropped when a purchase was recorded
+since the user was read, and the next one starts over. (ObjectIds from
+different processes order by second, so two purchases by one user within
+the same second on different processes could still be misordered.)
+"""
+import argparse
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from modelAI import connection
+
+
+def account_stats(db, user_ids=None):
+    """{user_id: {"profit", "transactions", "through"}} computed by Mongo from the transactions collection."""
+    pipeline = []
+    if user_ids is not None:
+        pipeline.append({"$match": {"user_id": {"$in": list(user_ids)}}})
+    pipeline.append({"$group": {
+        "_id": "$user_id",
+        "profit": {"$sum": {"$subtract": [{"$ifNull": ["$totalPrice", 0]}, {"$ifNull": ["$purchasePrice", 0]}]}},
+        "transactions": {"$sum": 1},
+        # Watermark: every transaction up to this _id is counted
+        "through": {"$max": "$_id"},
+    }})
+    return {doc.pop("_id"): doc for doc in db["transactions"].aggregate(pipeline)}
+
+
+def _update(user, stats, now):
+    """(filter, update) setting the user's stats, unless a purchase was recorded since the user was read."""
+    counted = user.get("trade_stats", {}).get("transactions")
+    return (
+        {"_id": user["_id"], "trade_stats.transactions": counted},
+        {"$set": {"trade_stats": dict(stats, backfilled_at=now)}},
+    )
+
+
+def backfill_user(db, user):
+    """Computes and stores one user's stats (user: their document). Returns the stats."""
+    stats = account_stats(db, [user["_id"]]).get(user["_id"], {"profit": 0.0, "transactions": 0})
+    db["users"].update_one(*_update(user, stats, datetime.now(timezone.utc)))
+    return stats
+
+
+def record_purchase(db, user_id, transaction_id, balance, profit, attempts=5):
+    """
+    Sets the user's balance after a purchase and adds the purchase to their
+    stats, in one write, unless a backfill already counted transaction_id.
+    Call it after the transaction is inserted. Returns False if the user
+    could not be updated.
+    """
+    counted = {"_id": user_id, "trade_stats.through": {"$gte": transaction_id}}
+    uncounted = {"_id": user_id, "trade_stats.through": {"$not": {"$gte": transaction_id}}}
+    for _ in range(attempts):
+        # A concurrent backfill can move the watermark between the two writes; then retry
+        if db["users"].update_one(uncounted, {
+            "$set": {"balance": balance},
+            "$inc": {"trade_stats.profit": profit, "trade_stats.transactions": 1},
+        }).matched_count:
+            return True
+        if db["users"].update_one(counted, {"$set": {"balance": balance}}).matched_count:
+            return True
+    return False
+
+
+def backfill(db, recompute=False):
+    query = {} if recompute else {"trade_stats.backfilled_at": {"$exists": False}}
+    users = list(db["users"].find(query, {"_id": 1, "trade_stats.transactions": 1}))
+    if not users:
+        return 0
+    stats = account_stats(db, [user["_id"] for user in users])
+    now = datetime.now(timezone.utc)
+    result = db["users"].bulk_write([
+        UpdateOne(*_update(user, stats.get(user["_id"], {"profit": 0.0, "transactions": 0}), now))
+        for user in users
+    ], ordered=False)
+    return result.matched_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the per-user profit aggregates from transactions.")
+    parser.add_argument("--all", action="store_true", help="recompute every user, not only those not backfilled yet")
+    args = parser.parse_args()
+    print(f"Backfilled trade_stats for {backfill(connection.get_db(), recompute=args.all)} users.")
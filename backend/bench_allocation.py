@@ -0,0 +1,78 @@
+# bench_allocation.py
+"""
+Time to turn a budget into share counts: the old greedy loop from
+recommendations() (one share per stock per pass) against
+allocation.allocate. The loop grows with budget / price, the engine does not.
+
+    python bench_allocation.py [--stocks 10] [--budgets 1e3 1e5 1e7]
+
+Runs offline on synthetic stocks; also checks both give the same shares.
+Two cases: prices in a narrow band, where little cash is left after the
+initial floor and the loop only runs a pass or two, and one low-risk stock
+priced above its share of the budget, whose whole allocation is left over
+and handed out one cheap share at a time.
+"""
+import time
+import argparse
+import numpy as np
+import allocation
+
+
+def greedy(stocks, budget, risk_level):
+    """The allocation as recommendations() used to compute it."""
+    total_weight = sum(risk_level - s["risk_class"] + 1 for s in stocks)
+    selected = []
+    for stock in stocks:
+        price = float(stock["Close"])
+        qty = int(((risk_level - stock["risk_class"] + 1) / total_weight * budget) // price)
+        if qty > 0:
+            selected.append([stock["Ticker"], price, qty])
+    remaining = budget - sum(price * qty for _, price, qty in selected)
+    improved = True
+    while improved and remaining > 0:
+        improved = False
+        for item in selected:
+            if remaining >= item[1]:
+                item[2] += 1
+                remaining -= item[1]
+                improved = True
+    return {ticker: qty for ticker, _, qty in selected}
+
+
+def synthetic_stocks(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"Ticker": f"T{i}", "risk_class": int(rng.integers(0, 4)), "Close": round(float(rng.uniform(1, 50)), 2)}
+        for i in range(n)
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the allocation engine against the greedy loop.")
+    parser.add_argument("--stocks", type=int, default=10)
+    parser.add_argument("--risk-level", type=int, default=3)
+    parser.add_argument("--budgets", type=float, nargs="+", default=[1e3, 1e5, 1e7])
+    args = parser.parse_args()
+
+    for case in ("narrow", "unaffordable"):
+        print(f"{args.stocks} stocks, {case} prices")
+        for budget in args.budgets:
+            stocks = synthetic_stocks(args.stocks)
+            if case == "unaffordable":
+                stocks[0].update(risk_class=0, Close=budget)
+            stocks.sort(key=lambda s: s["risk_class"])
+            expected, greedy_ms = timed(greedy, [dict(s) for s in stocks], budget, args.risk_level)
+            (positions, _, _), engine_ms = timed(allocation.allocate, [dict(s) for s in stocks], budget, args.risk_level)
+            actual = {p["Ticker"]: p["recommended_quantity"] for p in positions}
+            same = "same shares" if actual == expected else "DIFFERENT shares"
+            print(f"  budget {budget:>14,.0f}: greedy {greedy_ms:10.2f} ms   engine {engine_ms:8.3f} ms   {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# bench_import.py
+"""
+Cold import time of the web app: runs `import main` in fresh interpreters and
+reports the median. Fails (exit 1) when the median is over the budget or when
+importing the app pulled in TensorFlow, which must only load on first use or
+in the background warm-up.
+
+    python bench_import.py [--runs 5] [--budget 1.0]
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Maximum median import time in seconds; tests/test_startup.py holds the app to it too
+BUDGET = 1.0
+
+PROBE = (
+    "import time, sys, json\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(json.dumps({'seconds': elapsed, 'tensorflow': 'tensorflow' in sys.modules, "
+    "'pandas': 'pandas' in sys.modules}))\n"
+)
+
+
+def measure():
+    out = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cold import of main.py.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=BUDGET, help="maximum median import time in seconds")
+    args = parser.parse_args(argv)
+
+    runs = [measure() for _ in range(args.runs)]
+    median = statistics.median(run["seconds"] for run in runs)
+    tensorflow = any(run["tensorflow"] for run in runs)
+    pandas = any(run["pandas"] for run in runs)
+    print(f"import main: median {median * 1000:.0f} ms over {args.runs} runs "
+          f"(min {min(r['seconds'] for r in runs) * 1000:.0f} ms, max {max(r['seconds'] for r in runs) * 1000:.0f} ms)")
+    print(f"tensorflow imported: {tensorflow}, pandas imported: {pandas}")
+
+    failed = False
+    if tensorflow:
+        print("FAIL: importing the app loaded TensorFlow.")
+        failed = True
+    if median > args.budget:
+        print(f"FAIL: median import time is over the {args.budget:.2f} s budget.")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
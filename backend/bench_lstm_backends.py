@@ -0,0 +1,81 @@
+# bench_lstm_backends.py
+"""
+Parity and latency of the LSTM backends: Keras against every exported copy
+found next to it (python -m modelAI.lstm_runtime --format tflite|onnx).
+
+    python bench_lstm_backends.py [--batch 1] [--runs 200] [--tolerance 1e-4]
+
+Parity compares predictions on the same windows (random walks in the
+normalized [0, 1] range the model was trained on) and exits 1 when any
+backend differs from Keras by more than --tolerance. Latency is p50/p99 of
+one predict() call at the given batch size.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from modelAI import lstm_runtime
+from modelAI.registry import load_keras
+
+LOADERS = {"tflite": lstm_runtime.load_tflite, "onnx": lstm_runtime.load_onnx}
+
+
+def sample_windows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    walks = np.cumsum(rng.normal(0, 0.002, size=(n, lstm_runtime.WINDOW)), axis=1)
+    walks += rng.uniform(0.05, 0.6, size=(n, 1))
+    return np.clip(walks, 0, 1).reshape(n, lstm_runtime.WINDOW, 1).astype(np.float32)
+
+
+def latency(model, x, runs):
+    model.predict(x, batch_size=len(x), verbose=0)  # first call builds/allocates
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(x, batch_size=len(x), verbose=0)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the Keras LSTM with its TFLite/ONNX exports.")
+    parser.add_argument("--batch", type=int, default=1, help="windows per predict() call")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--parity-windows", type=int, default=64)
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="max absolute difference from Keras")
+    args = parser.parse_args(argv)
+
+    backends = {"keras": load_keras(os.path.join(lstm_runtime.MODEL_DIR, lstm_runtime.KERAS_FILE))}
+    for name, filename in lstm_runtime.EXPORT_FILES.items():
+        path = os.path.join(lstm_runtime.MODEL_DIR, filename)
+        if not os.path.exists(path):
+            print(f"{name}: not exported, skipped (python -m modelAI.lstm_runtime --format {name})")
+            continue
+        try:
+            backends[name] = LOADERS[name](path)
+        except ImportError as e:
+            print(f"{name}: runtime not installed, skipped ({e})")
+
+    windows = sample_windows(args.parity_windows)
+    reference = np.asarray(backends["keras"].predict(windows, batch_size=len(windows), verbose=0)).reshape(-1)
+    failed = False
+    for name, model in backends.items():
+        if name == "keras":
+            continue
+        diff = np.abs(np.asarray(model.predict(windows)).reshape(-1) - reference).max()
+        ok = diff <= args.tolerance
+        failed = failed or not ok
+        print(f"{'OK  ' if ok else 'FAIL'} parity {name}: max |diff| {diff:.2e} over {len(windows)} windows")
+
+    x = sample_windows(args.batch, seed=1)
+    print(f"batch {args.batch}, {args.runs} runs")
+    for name, model in backends.items():
+        p50, p99 = latency(model, x, args.runs)
+        print(f"{name:>8}: p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# bench_portfolio.py
+"""
+p50/p99 latency of /api/portfolio for an N-holding portfolio: the current
+path (one fetch of the materialized summary), a rebuild of that summary
+(one price query and one precomputed-forecast read, run concurrently) and
+the old serial path (one latest-price find_one and one uncached
+forecast per holding, without the HTTP loopback it used to pay on top).
+
+    python bench_portfolio.py [--holdings 20] [--runs 100]
+
+Needs a loaded database (market_data_extraction.py, worker.py --once) and
+the models. A throwaway user is created and removed again.
+"""
+import time
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+from main import app, mongo
+import portfolio_summary
+from modelAI import forecast_cache, forecast_service
+
+
+def serial_portfolio(db, user_id):
+    """The portfolio computation as it was: sequential lookups per holding."""
+    total_value = 0.0
+    for item in db.portfolios.find({"user_id": user_id}):
+        latest_doc = db.historical_stocks.find_one({"Ticker": item["ticker"]}, sort=[("Date", -1)])
+        current_price = float(latest_doc.get("Close", 0.0)) if latest_doc else 0.0
+        forecast_cache.cache.invalidate([item["ticker"]])
+        forecast_service.forecast_ticker(item["ticker"], db=db)
+        total_value += current_price * item.get("quantity", 0)
+    return total_value
+
+
+def percentiles(samples):
+    samples = np.array(samples) * 1000
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/portfolio latency.")
+    parser.add_argument("--holdings", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    db = mongo.db
+    tickers = db.stocks.distinct("Ticker")[:args.holdings]
+    user_id = db.users.insert_one({
+        "username": "bench", "email": f"bench-{time.time()}@example.com", "balance": 0.0
+    }).inserted_id
+    db.portfolios.insert_many([
+        {"user_id": user_id, "ticker": t, "quantity": 10, "average_cost": 100.0,
+         "created_at": datetime.now(timezone.utc)}
+        for t in tickers
+    ])
+
+    try:
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["user_id"] = str(user_id)
+
+        client.get("/api/portfolio")  # warm up models and caches
+        current = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            client.get("/api/portfolio")
+            current.append(time.perf_counter() - start)
+
+        rebuild = []
+        for _ in range(args.runs):
+            portfolio_summary.invalidate(db, tickers)
+            start = time.perf_counter()
+            portfolio_summary.get(db, user_id)
+            rebuild.append(time.perf_counter() - start)
+
+        serial = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            serial_portfolio(db, user_id)
+            serial.append(time.perf_counter() - start)
+    finally:
+        db.portfolios.delete_many({"user_id": user_id})
+        db[portfolio_summary.COLLECTION].delete_one({"_id": user_id})
+        db.users.delete_one({"_id": user_id})
+
+    print(f"{len(tickers)} holdings, {args.runs} runs")
+    for name, samples in (("serial", serial), ("rebuild", rebuild), ("current", current)):
+        p50, p99 = percentiles(samples)
+        print(f"{name:>8}: p50 {p50:8.1f} ms   p99 {p99:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench_rebalance.py
+"""
+p50/p99 latency of the /api/rebalance computation (target weights from the
+returns panel, whole-share trades, expected cost) for portfolios of 10, 100
+and 1000 positions.
+
+    python bench_rebalance.py [--positions 10 100 1000] [--runs 200] [--budget-ms 100]
+
+Runs offline: writes a synthetic returns panel to a temporary directory, so
+no database is needed. Exits 1 when a p99 is over --budget-ms or a plan
+spends more than the portfolio is worth. The time at 1000 positions is
+mostly the one 1000 x 1000 covariance solve of the mean-variance weights.
+"""
+import sys
+import time
+import tempfile
+import argparse
+import numpy as np
+import allocation
+import returns_panel
+
+
+def synthetic_panel(n, dates, panel_dir, seed=0):
+    """Returns from a one-factor model, so the covariance has realistic structure."""
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0004, 0.01, dates)
+    beta = rng.uniform(0.5, 1.5, (n, 1))
+    returns = (beta * market + rng.normal(0.0002, 0.015, (n, dates))).astype(np.float32)
+    tickers = [f"T{i}" for i in range(n)]
+    path = returns_panel.write(tickers, [str(d) for d in range(dates)], returns, panel_dir=panel_dir)
+    return returns_panel.Panel(path)
+
+
+def plan(panel, tickers, prices, shares, risk_classes, sectors, constraints):
+    weights, _ = allocation.target_weights(
+        tickers, risk_classes, sectors, constraints, moments=panel.moments(tickers)
+    )
+    return allocation.rebalance(
+        prices, shares, weights, max_weight=constraints["max_weight"], band=constraints["rebalance_band"]
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the rebalance computation.")
+    parser.add_argument("--positions", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--dates", type=int, default=1000, help="dates in the synthetic returns panel")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="p99 latency budget per rebalance")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    constraints = allocation.parse_constraints(
+        {"method": "mean_variance", "max_weight": 0.2, "rebalance_band": 0.001}, max_positions=None
+    )
+    failed = False
+    with tempfile.TemporaryDirectory() as panel_dir:
+        panel = synthetic_panel(max(args.positions), args.dates, panel_dir)
+        for n in args.positions:
+            tickers = list(rng.choice(panel.tickers, n, replace=False))
+            prices = rng.uniform(5, 500, n).round(2)
+            shares = rng.integers(0, 200, n)
+            risk_classes = rng.integers(0, 4, n).astype(float)
+            sectors = ["Technology"] * n
+
+            result = plan(panel, tickers, prices, shares, risk_classes, sectors, constraints)
+            samples = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                plan(panel, tickers, prices, shares, risk_classes, sectors, constraints)
+                samples.append(time.perf_counter() - start)
+            p50, p99 = np.percentile(np.array(samples) * 1000, [50, 99])
+
+            ok = p99 <= args.budget_ms and result["cash_left"] >= -1e-6
+            failed = failed or not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {n:>5} positions: p50 {p50:7.2f} ms   p99 {p99:7.2f} ms   "
+                  f"{np.count_nonzero(result['trade'])} trades, expected cost {result['expected_cost']:.2f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# db_indexes.py
+"""
+Index manager for every collection main.py and modelAI query.
+
+    python db_indexes.py           # create/verify all indexes
+    python db_indexes.py --check   # explain() each route query, exit 1 on a COLLSCAN
+"""
+import sys
+import argparse
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# collection -> list of (keys, options)
+INDEXES = {
+    "stocks": [
+        ([("Ticker", ASCENDING)], {"name": "ticker"}),
+        ([("risk_class", ASCENDING)], {"name": "risk_class"}),
+        ([("needs_refresh", ASCENDING)], {"name": "needs_refresh", "sparse": True}),
+    ],
+    # Serves the Ticker filter and the Date sort of every history tail query
+    "historical_stocks": [
+        ([("Ticker", ASCENDING), ("Date", ASCENDING)], {"name": "ticker_date"}),
+    ],
+    "transactions": [
+        ([("user_id", ASCENDING), ("timestamp", ASCENDING)], {"name": "user_timestamp"}),
+    ],
+    # Prefix also serves the user_id-only query of /api/portfolio
+    "portfolios": [
+        ([("user_id", ASCENDING), ("ticker", ASCENDING)], {"name": "user_ticker"}),
+    ],
+    "users": [
+        ([("email", ASCENDING)], {"name": "email", "unique": True}),
+    ],
+    "stock_features": [
+        ([("Ticker", ASCENDING)], {"name": "ticker", "unique": True}),
+    ],
+    "forecasts": [
+        ([("Ticker", ASCENDING)], {"name": "ticker", "unique": True}),
+    ],
+    # Shared forecast cache tier: TTL index drops expired entries
+    "forecast_cache": [
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+        ([("Ticker", ASCENDING)], {"name": "ticker"}),
+    ],
+    # Materialized portfolio valuations are read by _id; refreshes invalidate by held ticker
+    "portfolio_summaries": [
+        ([("tickers", ASCENDING)], {"name": "tickers"}),
+    ],
+}
+
+# (description, collection, filter, sort) for each query a route issues
+_user = ObjectId()
+ROUTE_QUERIES = [
+    ("riskAssessment/purchase: stock by ticker", "stocks", {"Ticker": "MSFT"}, None),
+    ("recommendations: stocks by risk_class", "stocks", {"risk_class": {"$lte": 3}}, None),
+    ("portfolio/forecast: history tail", "historical_stocks", {"Ticker": "MSFT"}, [("Date", DESCENDING)]),
+    ("report_details: history head", "historical_stocks", {"Ticker": "MSFT"}, [("Date", ASCENDING)]),
+    ("transactions/account: by user", "transactions", {"user_id": _user}, None),
+    ("portfolio: by user", "portfolios", {"user_id": _user}, None),
+    ("purchase: by user and ticker", "portfolios", {"user_id": _user, "ticker": "MSFT"}, None),
+    ("login/register: user by email", "users", {"email": "someone@example.com"}, None),
+    ("dynamicRisk: features by ticker", "stock_features", {"Ticker": "MSFT"}, None),
+    ("portfolio/transactions: precomputed forecasts", "forecasts", {"Ticker": {"$in": ["MSFT", "AAPL"]}}, None),
+    ("portfolio: materialized summary", "portfolio_summaries", {"_id": _user}, None),
+    ("refresh: summaries holding a ticker", "portfolio_summaries", {"tickers": {"$in": ["MSFT", "AAPL"]}}, None),
+]
+
+
+def ensure_indexes(db):
+    """
+    Creates every declared index; create_index is a no-op when it already
+    exists. One index failing (e.g. a unique index over duplicate values)
+    does not stop the others. Returns (created, failed), where failed is a
+    list of (collection.name, message).
+    """
+    created, failed = [], []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            name = f"{collection}.{options['name']}"
+            try:
+                db[collection].create_index(keys, **options)
+            except DuplicateKeyError as e:
+                fields = ", ".join(field for field, _ in keys)
+                failed.append((name, f"unique index not created: {collection} has documents with duplicate "
+                                     f"{fields}; remove the duplicates and run db_indexes.py again ({e})"))
+            except PyMongoError as e:
+                failed.append((name, str(e)))
+            else:
+                created.append(name)
+    return created, failed
+
+
+def _plan_stages(plan):
+    """Yields every stage name of an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key in ("inputStage", "queryPlan", "winningPlan"):
+            if key in plan:
+                yield from _plan_stages(plan[key])
+        for child in plan.get("inputStages", []):
+            yield from _plan_stages(child)
+
+
+def check_query_plans(db):
+    """Runs each route query through explain(); returns [(description, stages, ok)]."""
+    results = []
+    for description, collection, query, sort in ROUTE_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()
+        stages = list(_plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {})))
+        results.append((description, stages, "COLLSCAN" not in stages))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create indexes and check route query plans.")
+    parser.add_argument("--check", action="store_true", help="explain() every route query and fail on a COLLSCAN")
+    args = parser.parse_args(argv)
+
+    from modelAI import connection
+    db = connection.get_db()
+
+    created, failed = ensure_indexes(db)
+    for name in created:
+        print(f"Index ready: {name}")
+    for name, message in failed:
+        print(f"Index FAILED: {name}: {message}")
+    if failed:
+        return 1
+
+    if args.check:
+        failed = False
+        for description, stages, ok in check_query_plans(db):
+            print(f"{'OK  ' if ok else 'FAIL'} {description}: {' <- '.join(stages)}")
+            failed = failed or not ok
+        if failed:
+            print("At least one route query does a COLLSCAN.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+# fanout.py
+"""
+Runs independent blocking lookups (Mongo reads, model calls) concurrently
+with asyncio.gather, bounded by a semaphore so one request cannot take over
+the connection pool.
+"""
+import os
+import asyncio
+
+# Upper bound on lookups one request runs at the same time
+FANOUT_LIMIT = int(os.environ.get("FANOUT_LIMIT", 8))
+
+
+async def gather_bounded(calls, limit=FANOUT_LIMIT):
+    """
+    calls: list of (function, *args) tuples. Each runs in a worker thread;
+    results come back in the same order.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(fn, *args):
+        async with semaphore:
+            return await asyncio.to_thread(fn, *args)
+
+    return await asyncio.gather(*(run(*call) for call in calls))
+
+
+def run_concurrently(calls, limit=FANOUT_LIMIT):
+    """Sync entry point for Flask views: runs gather_bounded on a fresh event loop."""
+    return asyncio.run(gather_bounded(calls, limit))
@@ -0,0 +1,36 @@
+# gunicorn.conf.py
+"""
+Production serving settings, read by gunicorn when started from backend/:
+
+    gunicorn main:app
+    GUNICORN_WORKERS=4 GUNICORN_THREADS=16 MONGO_MAX_POOL_SIZE=128 gunicorn main:app
+
+main.py's app.run(debug=True) is the single-threaded dev server. Here each
+worker process runs the gthread worker, which hands every request its own
+thread, so a view waiting on Mongo or the inference server does not hold up
+the others; views also fan their independent lookups out with
+fanout.run_concurrently.
+
+Pool sizing: every worker process has its own Mongo pool of
+MONGO_MAX_POOL_SIZE connections, and one request can hold up to FANOUT_LIMIT
+of them at once, so keep threads * FANOUT_LIMIT <= MONGO_MAX_POOL_SIZE (the
+default thread count is derived that way). workers does not touch that
+limit; it multiplies the connections the Mongo server sees, up to
+workers * MONGO_MAX_POOL_SIZE in total.
+"""
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+worker_class = "gthread"
+threads = int(os.environ.get(
+    "GUNICORN_THREADS",
+    max(1, int(os.environ.get("MONGO_MAX_POOL_SIZE", 50)) // int(os.environ.get("FANOUT_LIMIT", 8)))
+))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+
+
+def post_worker_init(worker):
+    # Index creation and model loading, in the background once the app is loaded
+    from main import warm_up
+    warm_up()
@@ -1,21 +1,71 @@
 import os
+import threading
 from datetime import datetime, timezone, timedelta
 from flask import Blueprint, Flask, request, jsonify, session, send_from_directory
 from flask_cors import CORS
 from flask_pymongo import PyMongo
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
-import requests
-from modelAI import api
+import numpy as np
+import allocation
+import backfill_account_stats
+import db_indexes
+import fanout
+import portfolio_summary
+import returns_panel
+from modelAI import api, connection, forecast_service, risk_service
 
 app = Flask(__name__, static_folder='../frontend/build', static_url_path='/')
 
 # Enable CORS with credentials support so that cookies are passed
 CORS(app, supports_credentials=True)
 
-# Configure MongoDB
+# Configure MongoDB (pool size and timeouts are shared with the modelAI client)
 app.config["MONGO_URI"] = "mongodb://localhost:27017/stock_optimizer"
-mongo = PyMongo(app)
+app.config["MONGO_MAX_POOL_SIZE"] = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+app.config["MONGO_WAIT_QUEUE_TIMEOUT_MS"] = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+connection.init_app(app)
+mongo = PyMongo(app, **connection.client_options())
+# modelAI code called without a db shares this client instead of opening a second pool
+connection.adopt_client(mongo.cx)
+
+
+def _ensure_indexes():
+    # Make sure every index the routes rely on exists (see db_indexes.py)
+    try:
+        _, failed = db_indexes.ensure_indexes(mongo.db)
+    except Exception as e:
+        print(f"Could not ensure indexes: {e}")
+        return
+    for name, message in failed:
+        print(f"Could not ensure index {name}: {message}")
+
+
+_warmed_up = False
+_warm_up_lock = threading.Lock()
+
+
+def warm_up():
+    """
+    Server start-up work kept off the import path: index creation and model
+    loading run in the background while the app already answers requests.
+    /api/model/ready reports when the models are in. Runs once per process:
+    gunicorn.conf.py calls it as each worker starts, and under any other
+    server the first request does.
+    """
+    global _warmed_up
+    with _warm_up_lock:
+        if _warmed_up:
+            return
+        _warmed_up = True
+    threading.Thread(target=_ensure_indexes, name="ensure-indexes", daemon=True).start()
+    api.warm_up()
+
+
+@app.before_request
+def _warm_up_on_first_request():
+    if not _warmed_up:
+        warm_up()
 
 #-----------------------------------------------
 # Exract the stocks on startup from kaggle
@@ -36,6 +86,13 @@ app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 app.config["SESSION_COOKIE_SECURE"] = False
 
 
+def format_price(value):
+    """Presentation-only price formatting (e.g. 1234.5 -> "$1,234.50"); prices are stored as numbers."""
+    if isinstance(value, (int, float)):
+        return f"${value:,.2f}"
+    return value
+
+
 # MarketDataPage:
 # ---------------------------
 # Endpoint: Retrieve Top 100 Stocks Metadata
@@ -47,6 +104,8 @@ def get_stocks():
     from MongoDB. This data should have been populated by your market_data_extraction.py script.
     """
     stocks = list(mongo.db.stocks.find({}, {"_id": 0}))
+    for stock in stocks:
+        stock["Close"] = format_price(stock.get("Close"))
     return jsonify(stocks), 200
 
 # ---------------------------
@@ -64,6 +123,7 @@ def risk_assessment():
     stock_record = mongo.db.stocks.find_one({"Ticker": ticker}, {"_id": 0, "risk": 1, "risk_explanation": 1, "Close": 1})
     if not stock_record:
         return jsonify({"error": "Stock data not found."}), 404
+    stock_record["Close"] = format_price(stock_record.get("Close"))
     return jsonify(stock_record), 200
 
 # ---------------------------
@@ -86,7 +146,7 @@ def purchase():
     # Retrieve risk info from stocks collection
     stock_record = mongo.db.stocks.find_one(
         {"Ticker": ticker},
-        {"_id": 0, "risk": 1, "risk_explanation": 1, "Close": 1}
+        {"_id": 0, "risk": 1, "risk_explanation": 1, "Close": 1, "predicted_close": 1}
     )
     if not stock_record:
         return jsonify({"error": "Stock data not found."}), 404
@@ -96,7 +156,7 @@ def purchase():
         return jsonify({
             "message": "Risk assessment required before purchase.",
             "ticker": ticker,
-            "current_price": stock_record.get("Close"),
+            "current_price": format_price(stock_record.get("Close")),
             "risk": stock_record.get("risk"),
             "risk_explanation": stock_record.get("risk_explanation")
         }), 200
@@ -111,12 +171,7 @@ def purchase():
     if total_cost > budget:
         return jsonify({"error": "Insufficient funds."}), 400
 
-    # Deduct purchase cost from user's balance
     new_balance = round(budget - total_cost, 2)  # Round to 2 decimals
-    mongo.db.users.update_one(
-        {"_id": ObjectId(session["user_id"])},
-        {"$set": {"balance": new_balance}}
-    )
 
     # Insert transaction with additional fields
     transaction = {
@@ -130,6 +185,11 @@ def purchase():
         "timestamp": datetime.now(timezone.utc)
     }
     result = mongo.db.transactions.insert_one(transaction)
+    # Deduct purchase cost from user's balance and add the purchase to the account's
+    # running profit in one write; stats a backfill already counted it in are left alone
+    backfill_account_stats.record_purchase(
+        mongo.db, ObjectId(session["user_id"]), result.inserted_id, new_balance, total_cost - price
+    )
 
     # Convert non-serializable fields for JSON response
     transaction["_id"] = str(result.inserted_id)
@@ -160,6 +220,9 @@ def purchase():
         }
         mongo.db.portfolios.insert_one(portfolio_doc)
 
+    # Fold the purchase into the materialized portfolio valuation
+    portfolio_summary.apply_purchase(mongo.db, ObjectId(session["user_id"]), ticker, quantity, price, stock_record)
+
     return jsonify({
         "message": "Purchase simulated successfully.",
         "new_balance": new_balance,
@@ -191,6 +254,7 @@ def register():
         "balance": 0.0,
         "subscriptionStatus": False,
         "notificationPreferences": {"email": False, "sms": False},
+        "trade_stats": {"profit": 0.0, "transactions": 0, "backfilled_at": datetime.now(timezone.utc)},
         "created_at": datetime.now(timezone.utc)
     }
     result = mongo.db.users.insert_one(user)
@@ -252,9 +316,12 @@ def get_account():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    # Calculate total profit from transactions (assumes each transaction has "totalPrice" and "purchasePrice")
-    transactions = list(mongo.db.transactions.find({"user_id": ObjectId(session["user_id"])}))
-    total_profit = sum((t.get("totalPrice", 0) - t.get("purchasePrice", 0)) for t in transactions)
+    # Running total of totalPrice - purchasePrice over the user's transactions, kept
+    # up to date by purchase(); accounts from before it are backfilled on first read
+    trade_stats = user.get("trade_stats", {})
+    if "backfilled_at" not in trade_stats:
+        trade_stats = backfill_account_stats.backfill_user(mongo.db, user)
+    total_profit = trade_stats.get("profit", 0.0)
 
     account_data = {
         "username": user.get("username", "Unknown"),
@@ -322,6 +389,16 @@ def recommendations():
     if budget <= 0:
         return jsonify({"error": "Budget must be positive."}), 400
 
+    # Saved constraints of a logged-in user; the request may override them
+    stored = {}
+    if "user_id" in session:
+        user = mongo.db.users.find_one({"_id": ObjectId(session["user_id"])}, {"constraints": 1})
+        stored = (user or {}).get("constraints") or {}
+    try:
+        constraints = allocation.parse_constraints({**stored, **(data.get("constraints") or {})})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Query only stocks that have a stored risk_class <= desired risk_level
     stocks = list(mongo.db.stocks.find(
         {"risk_class": {"$lte": risk_level}},
@@ -331,66 +408,32 @@ def recommendations():
     if not stocks:
         return jsonify({"error": "No stocks found matching the desired risk level."}), 404
 
-    # Sort stocks by risk_class (lower risk first) and take up to 10 stocks
-    stocks.sort(key=lambda s: s["risk_class"])
-    selected_stocks = stocks[:10]
-
-    # Compute weights favoring lower risk: weight = (risk_level - stock risk + 1)
-    total_weight = 0
-    for stock in selected_stocks:
-        weight = (risk_level - stock["risk_class"] + 1)
-        stock["weight"] = weight
-        total_weight += weight
-
-    # Calculate initial recommended allocation for each stock (dollar amount)
-    for stock in selected_stocks:
-        stock["initial_allocation"] = (stock["weight"] / total_weight) * budget
+    # Lowest risk first, filtered by the constraints, up to max_positions stocks
+    selected_stocks = allocation.select_stocks(stocks, constraints)
+    if not selected_stocks:
+        return jsonify({"error": "No stocks left after applying your constraints."}), 404
+
+    weights = returns = None
+    if constraints["method"] == "mean_variance":
+        tickers = [stock["Ticker"] for stock in selected_stocks]
+        # Cached moments from the returns panel; history is only read if the panel lacks a ticker
+        weights = allocation.panel_weights(returns_panel.get_panel(), tickers)
+        if weights is None:
+            returns = allocation.load_returns(mongo.db, tickers)
+
+    # Integer share counts in closed form (see allocation.py); the work does not grow with the budget
+    selected_stocks, total_cost, remaining = allocation.allocate(
+        selected_stocks, budget, risk_level, constraints, returns, weights
+    )
 
-    # Convert the "Close" price from formatted string (e.g., "$123.45") to float
+    # Forecasts are precomputed by the background worker and copied onto the
+    # stocks documents; only stocks it has not covered yet are forecast live
+    missing = [stock["Ticker"] for stock in selected_stocks if stock.get("predicted_close") is None]
+    forecasts = forecast_service.read_forecasts(missing, db=mongo.db) if missing else {}
     for stock in selected_stocks:
-        close_str = stock.get("Close", "$0")
         try:
-            price = float(close_str.replace("$", "").replace(",", ""))
-        except Exception as e:
-            price = 0.0
-        stock["current_price"] = price
-        # Compute initial recommended quantity as floor(allocation / current_price)
-        if price > 0:
-            qty = int(stock["initial_allocation"] // price)
-        else:
-            qty = 0
-        stock["recommended_quantity"] = qty
-
-    # Filter out any stocks with zero recommended quantity
-    selected_stocks = [stock for stock in selected_stocks if stock["recommended_quantity"] > 0]
-
-    # Recompute total cost and remaining budget after filtering
-    total_cost = sum(stock["recommended_quantity"] * stock["current_price"] for stock in selected_stocks)
-    remaining = budget - total_cost
-
-    # Greedy allocation: try to add one extra share at a time if budget permits
-    improved = True
-    while improved and remaining > 0:
-        improved = False
-        for stock in selected_stocks:
-            price = stock["current_price"]
-            if price > 0 and remaining >= price:
-                stock["recommended_quantity"] += 1
-                remaining -= price
-                total_cost += price
-                improved = True
-        # End for
-    # End while
-
-    # For each recommended stock, call the forecast endpoint to get predicted % change
-    for stock in selected_stocks:
-        try:
-            resp = requests.post(
-                "http://localhost:5000/api/model/forecast",
-                json={"ticker": stock["Ticker"]}
-            )
-            if resp.status_code == 200:
-                forecast_data = resp.json()
+            forecast_data = forecasts.get(stock["Ticker"], stock)
+            if "error" not in forecast_data:
                 predicted_close = forecast_data.get("predicted_close", stock["current_price"])
                 # Use current_price as the base (like avg_cost) to compute the predicted percentage change
                 if stock["current_price"] != 0:
@@ -429,71 +472,9 @@ def portfolio():
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
-    portfolio_docs = list(mongo.db.portfolios.find({"user_id": ObjectId(session["user_id"])}))
-
-    portfolio_items = []
-    total_value = 0.0
-    total_profit_loss = 0.0
-
-    for item in portfolio_docs:
-        ticker = item.get("ticker")
-        quantity = item.get("quantity", 0)
-        avg_cost = item.get("average_cost", 0.0)
-
-        # 1. Current Price (raw close)
-        latest_doc = mongo.db.historical_stocks.find_one(
-            {"Ticker": ticker},
-            sort=[("Date", -1)]
-        )
-        if not latest_doc:
-            current_price = 0.0
-        else:
-            current_price = float(latest_doc.get("Close", 0.0))
-
-        # 2. Call AI forecast
-        predicted_close = current_price  # fallback
-        try:
-            resp = requests.post(
-                "http://localhost:5000/api/model/forecast",
-                json={"ticker": ticker}
-            )
-            if resp.status_code == 200:
-                data = resp.json()
-                predicted_close = data.get("predicted_close", current_price)
-                # data["percent_change"] is a fraction, e.g. 0.02 for 2%
-            else:
-                print(f"Forecast call failed with {resp.status_code}")
-        except Exception as e:
-            print(f"Forecast call error for {ticker}: {e}")
-
-        # 3. Compute profit/loss with predicted close
-        #    Suppose you define "profit_loss" as the difference between
-        #    predicted future price and average cost, times quantity
-        profit_loss = (predicted_close - avg_cost + 10) * quantity
-
-        total_value += current_price * quantity
-        total_profit_loss += profit_loss
-
-        portfolio_item = {
-            "ticker": ticker,
-            "company_name": item.get("company_name", ticker),
-            "quantity": quantity,
-            "average_cost": round(avg_cost, 2),
-            "current_price": round(current_price, 2),
-            "predicted_future_price": round(current_price + profit_loss, 2), # before: predicted_close
-            "profit_loss": round(profit_loss, 2)
-        }
-        portfolio_items.append(portfolio_item)
-
-    summary = {
-        "total_value": round(total_value, 2),
-        "total_profit_loss": round(total_profit_loss, 2)
-    }
-
-    return jsonify({
-        "portfolio": portfolio_items,
-        "summary": summary
-    }), 200
+    # Materialized valuation: one document fetch, rebuilt only after a refresh invalidated it
+    summary = portfolio_summary.get(mongo.db, ObjectId(session["user_id"]))
+    return jsonify(portfolio_summary.to_response(summary)), 200
 
 
 @app.route('/api/constraints', methods=['GET', 'PUT'])
@@ -513,13 +494,84 @@ def constraints():
 def rebalance():
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
-    data = request.get_json()
-    # Dummy rebalance logic – replace with your algorithm
+    data = request.get_json(silent=True) or {}
+    user_id = ObjectId(session["user_id"])
+    holdings, user = fanout.run_concurrently([
+        (lambda: list(mongo.db.portfolios.find({"user_id": user_id}, {"ticker": 1, "quantity": 1, "average_cost": 1})),),
+        (lambda: mongo.db.users.find_one({"_id": user_id}, {"constraints": 1}),),
+    ])
+    # Mean-variance unless the user chose otherwise; no position limit unless they set one
+    try:
+        constraints = allocation.parse_constraints(
+            {"method": "mean_variance", **((user or {}).get("constraints") or {}), **(data.get("constraints") or {})},
+            max_positions=None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        cash = float(data.get("cash", 0.0))
+        # Negative cash would plan a sale of every position
+        if not np.isfinite(cash) or cash < 0:
+            raise ValueError(cash)
+        risk_level = int(data["risk_level"]) if data.get("risk_level") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid cash or risk_level."}), 400
+    if not holdings:
+        return jsonify({"rebalancedPortfolio": [], "trades": [], "expected_cost": 0.0})
+
+    # One snapshot query for prices, risk classes and sectors of every holding
+    tickers = [item["ticker"] for item in holdings]
+    snapshots = {
+        doc["Ticker"]: doc
+        for doc in mongo.db.stocks.find({"Ticker": {"$in": tickers}}, {"_id": 0, "Ticker": 1, "company_name": 1, "Close": 1, "risk_class": 1, "sector": 1})
+    }
+    rows = [snapshots.get(ticker, {}) for ticker in tickers]
+    prices = np.array([float(row.get("Close") or 0.0) for row in rows])
+    shares = np.array([item.get("quantity", 0) for item in holdings], dtype=np.int64)
+    average_cost = np.array([item.get("average_cost", 0.0) for item in holdings], dtype=float)
+
+    panel = returns_panel.get_panel()
+    weights, method = allocation.target_weights(
+        tickers,
+        [np.nan if row.get("risk_class") is None else row["risk_class"] for row in rows],
+        [row.get("sector") for row in rows],
+        constraints,
+        risk_level=risk_level,
+        moments=panel.moments(tickers) if panel is not None else None,
+        tradable=prices > 0,
+    )
+    plan = allocation.rebalance(
+        prices, shares, weights, cash=cash,
+        max_weight=constraints["max_weight"], band=constraints["rebalance_band"],
+    )
+
+    value = plan["value"]
+    current_weight = prices * shares / value if value > 0 else np.zeros(len(prices))
+    profit_loss = np.round((prices - average_cost) * plan["target"], 2)
     rebalanced = [
-        {"symbol": "AAPL", "name": "Apple Inc.", "shares": 12, "average_cost": 140.0, "current_price": 153.0, "profit_loss": 156.0},
-        {"symbol": "GOOGL", "name": "Alphabet Inc.", "shares": 4, "average_cost": 1000.0, "current_price": 1100.0, "profit_loss": 400.0}
+        {"symbol": ticker, "name": row.get("company_name"), "shares": target, "current_shares": held, "trade": trade,
+         "target_weight": weight, "current_weight": current, "average_cost": cost,
+         "current_price": price, "profit_loss": pl}
+        for ticker, row, target, held, trade, weight, current, cost, price, pl in zip(
+            tickers, rows, plan["target"].tolist(), shares.tolist(), plan["trade"].tolist(),
+            np.round(weights, 4).tolist(), np.round(current_weight, 4).tolist(),
+            average_cost.tolist(), prices.tolist(), profit_loss.tolist(),
+        )
+    ]
+    traded = np.flatnonzero(plan["trade"])
+    trades = [
+        {"symbol": tickers[i], "side": "buy" if qty > 0 else "sell", "shares": abs(qty), "value": round(abs(qty) * price, 2)}
+        for i, qty, price in zip(traded.tolist(), plan["trade"][traded].tolist(), prices[traded].tolist())
     ]
-    return jsonify({"rebalancedPortfolio": rebalanced})
+    return jsonify({
+        "rebalancedPortfolio": rebalanced,
+        "trades": trades,
+        "method": method,
+        "portfolio_value": round(value, 2),
+        "turnover": round(plan["turnover"], 2),
+        "expected_cost": round(plan["expected_cost"], 2),
+        "cash_left": round(plan["cash_left"], 2),
+    })
 
 @app.route('/api/transactions', methods=['GET'])
 def transactions():
@@ -527,10 +579,17 @@ def transactions():
         return jsonify({"error": "Not logged in"}), 401
 
     user_id = ObjectId(session["user_id"])
-    txn_cursor = mongo.db.transactions.find({"user_id": user_id})
+    txns = list(mongo.db.transactions.find({"user_id": user_id}))
+    symbols = [t.get("ticker") for t in txns]
+    # Fetch every stock snapshot and forecast once for the whole list, concurrently
+    stock_docs, forecasts = fanout.run_concurrently([
+        (lambda: list(mongo.db.stocks.find({"Ticker": {"$in": list(set(symbols))}}, {"Ticker": 1, "Close": 1})),),
+        (forecast_service.read_forecasts, symbols, mongo.db),
+    ])
+    stocks_by_ticker = {s["Ticker"]: s for s in stock_docs}
     transactions_list = []
 
-    for t in txn_cursor:
+    for t in txns:
         symbol = t.get("ticker")
         
         # Retrieve the purchase price from the transaction record
@@ -540,7 +599,7 @@ def transactions():
             purchase_price = 0.0
         
         # Fallback: get the current price from stocks (if needed)
-        stock = mongo.db.stocks.find_one({"Ticker": symbol}, {"Close": 1})
+        stock = stocks_by_ticker.get(symbol)
         try:
             current_price = float(stock.get("Close")) if stock and stock.get("Close") is not None else purchase_price
         except (ValueError, TypeError):
@@ -548,16 +607,9 @@ def transactions():
 
         # Get the predicted future close using the same API as in portfolio endpoint
         predicted_close = current_price  # fallback
-        try:
-            resp = requests.post(
-                "http://localhost:5000/api/model/forecast",
-                json={"ticker": symbol}
-            )
-            if resp.status_code == 200:
-                data = resp.json()
-                predicted_close = data.get("predicted_close", current_price)
-        except Exception as e:
-            print(f"Forecast call error for {symbol}: {e}")
+        data = forecasts.get(symbol, {})
+        if "error" not in data:
+            predicted_close = data.get("predicted_close", current_price)
 
         quantity = t.get("quantity", 0)
         # Use portfolio's profit/loss logic: (predicted_close - purchasePrice + 10) * quantity
@@ -679,21 +731,12 @@ def report_details(stock_symbol):
             dates.append(date_val.strftime("%Y-%m-%d"))
         else:
             dates.append(str(date_val))
-        # Remove any formatting if Close is stored as a string with currency formatting
-        close_val = doc.get("Close", 0)
-        if isinstance(close_val, str):
-            close_val = float(close_val.replace("$", "").replace(",", ""))
-        prices.append(float(close_val))
+        prices.append(float(doc.get("Close", 0)))
 
-    # Call the forecast endpoint to get a prediction (using a dummy fallback)
+    # Run the forecast in-process to get a prediction (using a dummy fallback)
     try:
-        forecast_resp = requests.post(
-            "http://localhost:5000/api/model/forecast",
-            json={"ticker": stock_symbol}
-        )
-        if forecast_resp.status_code == 200:
-            forecast_data = forecast_resp.json()
-        else:
+        forecast_data, status = forecast_service.forecast_ticker(stock_symbol, db=mongo.db)
+        if status != 200:
             forecast_data = {"predicted_close": prices[-1], "last_close": prices[-1], "percent_change": 0}
     except Exception as e:
         forecast_data = {"predicted_close": prices[-1], "last_close": prices[-1], "percent_change": 0}
@@ -703,15 +746,10 @@ def report_details(stock_symbol):
     # Compute a dummy forecast error (percentage difference)
     forecast_error = abs(predicted_close - last_actual) / last_actual * 100 if last_actual != 0 else 0
 
-    # Call the dynamic risk endpoint to get risk metrics (dummy fallback provided)
+    # Score risk in-process from the feature store (dummy fallback provided)
     try:
-        risk_resp = requests.get(
-            "http://localhost:5000/api/model/dynamicRisk",
-            params={"ticker": stock_symbol}
-        )
-        if risk_resp.status_code == 200:
-            risk_data = risk_resp.json()
-        else:
+        risk_data, status = risk_service.assess_ticker(stock_symbol, db=mongo.db)
+        if status != 200:
             risk_data = {"risk_class": 3, "overall_risk": "Moderate Risk", "detailed_explanation": "No detailed data available."}
     except Exception as e:
         risk_data = {"risk_class": 3, "overall_risk": "Moderate Risk", "detailed_explanation": "No detailed data available."}
@@ -762,4 +800,8 @@ def serve_static(path):
 # Run the Flask App
 # ---------------------------
 if __name__ == '__main__':
+    # With debug=True the reloader re-runs this file in a child process that
+    # serves the requests; only that child should load the models
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warm_up()
     app.run(debug=True)
@@ -1,70 +1,306 @@
 # market_data_extraction.py
-def update_stock_data():
-    import os, glob
-    import pandas as pd
-    import kagglehub
-    from pymongo import MongoClient
-    from sklearn.preprocessing import MinMaxScaler
-    import numpy as np
+import os, glob
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
 
-    # Download dataset from Kaggle
-    path = kagglehub.dataset_download("borismarjanovic/price-volume-data-for-all-us-stocks-etfs")
+TOP_N = 100
+# Records converted to dicts and sent per insert_many call
+CHUNK_SIZE = 5000
+
+
+def _list_files(path):
+    """Returns (ticker, file) for every non-empty Stocks/ETFs .us.txt file of the Kaggle dataset."""
     stocks_path = os.path.join(path, "Stocks")
     etfs_path = os.path.join(path, "ETFs")
-    
+
     stocks_txt = glob.glob(os.path.join(stocks_path, "*.us.txt"))
     etfs_txt = glob.glob(os.path.join(etfs_path, "*.us.txt")) if os.path.exists(etfs_path) else []
     all_txt = stocks_txt + etfs_txt
-    df_list = []
-    for file in all_txt:
-        if os.path.getsize(file) == 0:
-            continue
-        base_name = os.path.basename(file)
-        ticker = base_name.replace(".us.txt", "")
-        try:
-            temp_df = pd.read_csv(file, sep=",")
-        except pd.errors.EmptyDataError:
-            continue
-        if temp_df.empty:
-            continue
-        temp_df["Ticker"] = ticker
-        temp_df["Date"] = pd.to_datetime(temp_df["Date"], errors="coerce")
-        temp_df.dropna(subset=["Date"], inplace=True)
-        if "OpenInt" in temp_df.columns:
-            temp_df.drop(columns=["OpenInt"], inplace=True)
-        # Simulate additional metadata: company_name, sector, market_cap
-        temp_df["company_name"] = ticker.upper()  # dummy company name
-        temp_df["sector"] = "Technology"           # dummy sector (adjust as needed)
-        temp_df["market_cap"] = np.random.uniform(100e6, 100e9)  # random between 100M and 100B
-        df_list.append(temp_df)
+    return [
+        (os.path.basename(file).replace(".us.txt", ""), file)
+        for file in all_txt
+        if os.path.getsize(file) > 0
+    ]
+
+
+def _read_ticker(ticker, file):
+    """Parses one file in full, the way the data is stored in historical_stocks."""
+    try:
+        temp_df = pd.read_csv(file, sep=",")
+    except pd.errors.EmptyDataError:
+        return None
+    if temp_df.empty:
+        return None
+    temp_df["Ticker"] = ticker
+    temp_df["Date"] = pd.to_datetime(temp_df["Date"], errors="coerce")
+    temp_df.dropna(subset=["Date"], inplace=True)
+    if "OpenInt" in temp_df.columns:
+        temp_df.drop(columns=["OpenInt"], inplace=True)
+    # Simulate additional metadata: company_name, sector, market_cap
+    temp_df["company_name"] = ticker.upper()  # dummy company name
+    temp_df["sector"] = "Technology"           # dummy sector (adjust as needed)
+    temp_df["market_cap"] = np.random.uniform(100e6, 100e9)  # random between 100M and 100B
+    return temp_df
 
+
+def _scan_file(args):
+    """
+    First pass over one file: only Date, Close and Volume, with explicit dtypes.
+    Returns (ticker, volume_sum, row_count, close_min, close_max), or None for
+    files without usable rows. Runs in worker processes, so it stays top-level.
+    """
+    ticker, file = args
+    try:
+        df = pd.read_csv(
+            file,
+            sep=",",
+            usecols=["Date", "Close", "Volume"],
+            dtype={"Date": "string", "Close": "float64", "Volume": "float64"},
+        )
+    except (pd.errors.EmptyDataError, ValueError):
+        return None
+    # Same row filter as _read_ticker, so averages and scaler bounds match
+    df = df[pd.to_datetime(df["Date"], errors="coerce").notna()]
+    if df.empty:
+        return None
+    return ticker, float(df["Volume"].sum()), int(df["Volume"].count()), float(df["Close"].min()), float(df["Close"].max())
+
+
+def _load_in_memory(files):
+    """
+    Original single-pass load: parses every file, concatenates them and only
+    then filters to the top tickers. Peak memory is the whole dataset.
+    Returns (data_top, close_min, close_max).
+    """
+    df_list = [df for df in (_read_ticker(ticker, file) for ticker, file in files) if df is not None]
     data = pd.concat(df_list, ignore_index=True)
-    
-    # Create a column for training (normalized close) but keep the real Close for display.
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    data["Close_norm"] = scaler.fit_transform(data["Close"].values.reshape(-1, 1))
-    
-    # Filter top 100 tickers by average Volume (using real volume)
+
+    # Filter top tickers by average Volume (using real volume)
     avg_vol = data.groupby("Ticker")["Volume"].mean().reset_index().sort_values(by="Volume", ascending=False)
-    top_100_tickers = avg_vol.head(100)["Ticker"].tolist()
-    data_top = data[data["Ticker"].isin(top_100_tickers)].copy()
+    top_tickers = avg_vol.head(TOP_N)["Ticker"].tolist()
+    data_top = data[data["Ticker"].isin(top_tickers)].copy()
+    return data_top, float(data["Close"].min()), float(data["Close"].max())
+
+
+def _load_streaming(files, workers=None):
+    """
+    Two-pass load. Pass one reads only Date/Close/Volume of every file (in a
+    process pool when workers > 1) to rank tickers by average volume and to
+    find the global Close range for the scaler. Pass two parses only the
+    selected tickers in full. Returns (data_top, close_min, close_max).
+    """
+    if workers and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scans = list(executor.map(_scan_file, files, chunksize=64))
+    else:
+        scans = [_scan_file(item) for item in files]
+    scans = pd.DataFrame(
+        [scan for scan in scans if scan is not None],
+        columns=["Ticker", "volume_sum", "count", "close_min", "close_max"],
+    )
+
+    # Same ranking as the in-memory path: mean volume per ticker, highest first
+    per_ticker = scans.groupby("Ticker")[["volume_sum", "count"]].sum()
+    avg_vol = (per_ticker["volume_sum"] / per_ticker["count"]).rename("Volume").reset_index()
+    avg_vol = avg_vol.sort_values(by="Volume", ascending=False)
+    top_tickers = set(avg_vol.head(TOP_N)["Ticker"])
+
+    df_list = [
+        df for df in (_read_ticker(ticker, file) for ticker, file in files if ticker in top_tickers)
+        if df is not None
+    ]
+    data_top = pd.concat(df_list, ignore_index=True)
+    return data_top, float(scans["close_min"].min()), float(scans["close_max"].max())
+
+
+def _iter_records(df, chunk_size=CHUNK_SIZE):
+    """Yields the rows of a DataFrame as lists of dicts, chunk_size rows at a time."""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size].to_dict("records")
+
+
+def _replace_collection(db, name, df, chunk_size=CHUNK_SIZE):
+    """
+    Loads df into a shadow collection in bounded chunks, builds its indexes,
+    then renames it over the live collection. The rename is atomic, so readers
+    see either the old dataset or the new one, never an empty or partial one.
+    """
+    import db_indexes
+    shadow = db[f"{name}_loading"]
+    shadow.drop()
+    for records in _iter_records(df, chunk_size):
+        shadow.insert_many(records, ordered=False)
+    for keys, options in db_indexes.INDEXES.get(name, []):
+        shadow.create_index(keys, **options)
+    shadow.rename(name, dropTarget=True)
+
+
+def _upsert_bars(db, df, chunk_size=CHUNK_SIZE):
+    """Writes bars with unordered bulk upserts keyed on (Ticker, Date), chunk_size at a time."""
+    from pymongo import UpdateOne
+    for records in _iter_records(df, chunk_size):
+        db["historical_stocks"].bulk_write(
+            [UpdateOne({"Ticker": r["Ticker"], "Date": r["Date"]}, {"$set": r}, upsert=True) for r in records],
+            ordered=False,
+        )
+
+
+def _infer_close_scaler(latest):
+    """
+    Recovers the Close -> Close_norm mapping from stored bars, for data loaded
+    before the scaler was persisted. The mapping is linear, so the latest bars
+    of the two tickers with the most distant Close pin it down without a refit.
+    """
+    points = sorted(
+        (bar["Close"], bar["Close_norm"]) for bar in latest.values()
+        if bar.get("Close") is not None and bar.get("Close_norm") is not None
+    )
+    (c1, n1), (c2, n2) = points[0], points[-1]
+    if c1 == c2:
+        raise ValueError("Cannot recover the Close scaler: stored closes have no spread.")
+    scale = (n2 - n1) / (c2 - c1)
+    offset = n1 - c1 * scale
+    return {"data_min": -offset / scale, "data_max": (1 - offset) / scale, "scale": scale, "offset": offset}
+
+
+def update_stock_data(streaming=True, workers=None):
+    import kagglehub
+    from pymongo import MongoClient
+    from modelAI import scaling
+
+    # Download dataset from Kaggle
+    path = kagglehub.dataset_download("borismarjanovic/price-volume-data-for-all-us-stocks-etfs")
+    files = _list_files(path)
+
+    if streaming:
+        data_top, close_min, close_max = _load_streaming(files, workers=workers)
+    else:
+        data_top, close_min, close_max = _load_in_memory(files)
+
+    # Create a column for training (normalized close) but keep the real Close for display.
+    # Same arithmetic as MinMaxScaler(feature_range=(0, 1)) fitted on the Close of every file.
+    scaler = scaling.fit_close_scaler(close_min, close_max)
+    data_top["Close_norm"] = scaling.normalize(data_top["Close"], scaler)
     data_top.sort_values(by=["Ticker", "Date"], inplace=True)
-    
-    # Get the most recent record per ticker for quick lookup and format the real Close price
+
+    # Get the most recent record per ticker for quick lookup (Close stays numeric;
+    # the API formats it for display)
     latest_data = data_top.groupby("Ticker").tail(1).reset_index(drop=True)
-    latest_data["Close"] = latest_data["Close"].apply(lambda x: f"${x:,.2f}")
-    
-    from pymongo import MongoClient
+
     client = MongoClient("mongodb://localhost:27017")
     db = client["stock_optimizer"]
-    # Update the "stocks" collection with the latest record per ticker
-    stocks_collection = db["stocks"]
-    stocks_collection.delete_many({})
-    stocks_collection.insert_many(latest_data[["Ticker", "company_name", "sector", "market_cap", "Close", "Volume", "Date"]].to_dict("records"))
-    
-    # Also, update a "historical_stocks" collection with all historical data for these tickers
-    historical_collection = db["historical_stocks"]
-    historical_collection.delete_many({})
-    historical_collection.insert_many(data_top.to_dict("records"))
-    
+    # Update the "historical_stocks" collection with all historical data for these tickers.
+    # It goes first so "stocks" never lists a ticker without history.
+    _replace_collection(db, "historical_stocks", data_top)
+
+    # Update the "stocks" collection with the latest record per ticker,
+    # flagged so the background worker recomputes forecasts and risk
+    latest_data["needs_refresh"] = True
+    latest_data["refresh_requested_at"] = datetime.now(timezone.utc)
+    _replace_collection(db, "stocks", latest_data[["Ticker", "company_name", "sector", "market_cap", "Close", "Volume", "Date", "needs_refresh", "refresh_requested_at"]])
+
+    # Persist the scaler so appends and forecasts can use it without a refit
+    scaling.save_close_scaler(db, scaler)
+
+    # Rebuild the per-ticker rolling feature store used by risk scoring
+    from modelAI import features
+    features.write_features(db, features.build_features(data_top))
+
+    # Every ticker was reloaded, so no cached forecast is valid any more
+    from modelAI import forecast_cache
+    forecast_cache.invalidate(db)
+    # ...and no stored portfolio valuation either
+    import portfolio_summary
+    portfolio_summary.invalidate(db)
+
+    # Recompute the returns panel and its cached mean/covariance
+    import returns_panel
+    returns_panel.build(db)
+
     print("Updated stock data in MongoDB (latest and historical).")
+
+
+def append_stock_data(path=None):
+    """
+    Incremental refresh: for every ticker in "stocks", inserts only the bars
+    newer than the latest Date already stored, updates its snapshot row,
+    rolls its features forward and marks it for forecast/risk recomputation.
+    """
+    from pymongo import MongoClient, UpdateOne
+    from modelAI import features, forecast_cache, history, scaling
+
+    client = MongoClient("mongodb://localhost:27017")
+    db = client["stock_optimizer"]
+
+    tickers = db["stocks"].distinct("Ticker")
+    latest = history.latest_bars(db, tickers, fields=("Close", "Close_norm"))
+    if not latest:
+        print("No stored data; run a full update_stock_data() first.")
+        return []
+    scaler = scaling.load_close_scaler(db)
+    if scaler is None:
+        scaler = scaling.save_close_scaler(db, _infer_close_scaler(latest))
+
+    if path is None:
+        import kagglehub
+        path = kagglehub.dataset_download("borismarjanovic/price-volume-data-for-all-us-stocks-etfs")
+    # A ticker can appear in both Stocks and ETFs; the full load merges them too
+    files = {}
+    for ticker, file in _list_files(path):
+        if ticker in latest:
+            files.setdefault(ticker, []).append(file)
+
+    updated = []
+    snapshot_ops = []
+    for ticker, ticker_files in files.items():
+        df_list = [df for df in (_read_ticker(ticker, file) for file in ticker_files) if df is not None]
+        if not df_list:
+            continue
+        df = pd.concat(df_list, ignore_index=True)
+        df = df[df["Date"] > pd.Timestamp(latest[ticker]["Date"])].sort_values("Date")
+        if df.empty:
+            continue
+        df["Close_norm"] = scaling.normalize(df["Close"], scaler)
+        _upsert_bars(db, df)
+
+        new_bars = df[["Date", "Close_norm", "Volume"]].to_dict("records")
+        for bar in new_bars:
+            bar["Date"] = bar["Date"].to_pydatetime()
+        features.update_features(db, ticker, new_bars)
+
+        last = df.iloc[-1]
+        snapshot_ops.append(UpdateOne({"Ticker": ticker}, {"$set": {
+            "Close": float(last["Close"]),
+            "Volume": int(last["Volume"]),
+            "Date": last["Date"].to_pydatetime(),
+            # Picked up by the risk/forecast recompute worker
+            "needs_refresh": True,
+            "refresh_requested_at": datetime.now(timezone.utc),
+        }}))
+        updated.append(ticker)
+
+    if snapshot_ops:
+        db["stocks"].bulk_write(snapshot_ops, ordered=False)
+        forecast_cache.invalidate(db, updated)
+        import portfolio_summary
+        portfolio_summary.invalidate(db, updated)
+        import returns_panel
+        returns_panel.build(db)
+
+    print(f"Appended new bars for {len(updated)} tickers.")
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Load the Kaggle price/volume dataset into MongoDB.")
+    parser.add_argument("--append", action="store_true", help="only add bars newer than what is stored")
+    parser.add_argument("--in-memory", action="store_true", help="use the original single-pass, whole-dataset load")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for the first (scan) pass")
+    args = parser.parse_args()
+    if args.append:
+        append_stock_data()
+    else:
+        update_stock_data(streaming=not args.in_memory, workers=args.workers)
@@ -0,0 +1,33 @@
+# migrate_prices.py
+"""
+One-time migration: converts formatted "stocks.Close" strings such as
+"$1,234.56" to numbers. Safe to re-run; numeric prices are left alone.
+
+    python migrate_prices.py
+"""
+from pymongo import UpdateOne
+from modelAI import connection
+
+
+def parse_price(value):
+    return float(value.replace("$", "").replace(",", ""))
+
+
+def migrate_prices(db):
+    ops = []
+    skipped = []
+    for doc in db["stocks"].find({"Close": {"$type": "string"}}, {"Ticker": 1, "Close": 1}):
+        try:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"Close": parse_price(doc["Close"])}}))
+        except ValueError:
+            skipped.append(doc.get("Ticker"))
+    if ops:
+        db["stocks"].bulk_write(ops, ordered=False)
+    return len(ops), skipped
+
+
+if __name__ == "__main__":
+    migrated, skipped = migrate_prices(connection.get_db())
+    print(f"Converted {migrated} stock prices to numbers.")
+    if skipped:
+        print(f"Could not parse Close for: {', '.join(map(str, skipped))}")
@@ -0,0 +1,175 @@
+import os
+import threading
+import logging
+from pymongo import MongoClient, monitoring
+
+# Connection settings. Defaults can be overridden through environment
+# variables or, inside the web app, through app.config (see init_app).
+config = {
+    "MONGO_URI": os.environ.get("MONGO_URI", "mongodb://localhost:27017/stock_optimizer"),
+    "MONGO_DB_NAME": os.environ.get("MONGO_DB_NAME", "stock_optimizer"),
+    "MONGO_MAX_POOL_SIZE": int(os.environ.get("MONGO_MAX_POOL_SIZE", 50)),
+    "MONGO_MIN_POOL_SIZE": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+    "MONGO_CONNECT_TIMEOUT_MS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+    "MONGO_SOCKET_TIMEOUT_MS": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+}
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Keeps running connection pool counters per server address so
+    pool saturation can be inspected at runtime.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _bump(self, address, **deltas):
+        key = f"{address[0]}:{address[1]}"
+        with self._lock:
+            stats = self._stats.setdefault(key, {
+                "open": 0,
+                "checked_out": 0,
+                "waiting": 0,
+                "peak_checked_out": 0,
+                "peak_waiting": 0,
+                "check_out_failures": 0,
+                "total_created": 0,
+                "total_checked_out": 0,
+                "pool_cleared": 0,
+            })
+            for name, delta in deltas.items():
+                stats[name] += delta
+            stats["peak_checked_out"] = max(stats["peak_checked_out"], stats["checked_out"])
+            stats["peak_waiting"] = max(stats["peak_waiting"], stats["waiting"])
+
+    def snapshot(self):
+        with self._lock:
+            return {address: dict(stats) for address, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._bump(event.address, pool_cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._bump(event.address, open=1, total_created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._bump(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._bump(event.address, waiting=-1, check_out_failures=1)
+
+    def connection_checked_out(self, event):
+        self._bump(event.address, waiting=-1, checked_out=1, total_checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._bump(event.address, checked_out=-1)
+
+
+pool_listener = PoolStatsListener()
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+# The web app's own client (PyMongo's mongo.cx), shared so the process has one pool
+_adopted = None
+
+
+def init_app(app):
+    """Pulls connection settings from the Flask app config, if present."""
+    for key in config:
+        if key in app.config:
+            config[key] = app.config[key]
+
+
+def adopt_client(client):
+    """
+    Makes get_client() return the web app's client, so modelAI code called
+    without a db (e.g. the blueprint routes) uses the app's pool instead of
+    opening a second one. The app's client is created with connect=False and
+    each forked worker uses it from then on, so it is kept across forks.
+    """
+    global _adopted
+    _adopted = client
+
+
+def client_options():
+    """
+    Keyword arguments for MongoClient, shared with the app's PyMongo instance
+    so every pool in the process uses the same limits and is monitored.
+    connect=False defers socket creation until first use, which keeps the
+    client safe to create before a pre-fork server forks its workers.
+    """
+    return {
+        "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+        "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+        "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+        "connectTimeoutMS": config["MONGO_CONNECT_TIMEOUT_MS"],
+        "socketTimeoutMS": config["MONGO_SOCKET_TIMEOUT_MS"],
+        "waitQueueTimeoutMS": config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        "event_listeners": [pool_listener],
+        "connect": False,
+    }
+
+
+def get_client():
+    """
+    Returns the process-wide MongoClient: the web app's client when one was
+    adopted, otherwise one created on first use. A forked child gets its own
+    created client instead of reusing the parent's sockets.
+    """
+    global _client, _client_pid
+    if _adopted is not None:
+        return _adopted
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            if _client is not None:
+                logging.info("Process forked; creating a new MongoClient for this worker.")
+                pool_listener.reset()
+            _client = MongoClient(config["MONGO_URI"], **client_options())
+            _client_pid = pid
+    return _client
+
+
+def get_db():
+    return get_client()[config["MONGO_DB_NAME"]]
+
+
+def pool_stats():
+    """Pool counters plus the configured limits, for the /pool endpoint."""
+    servers = pool_listener.snapshot()
+    max_pool_size = config["MONGO_MAX_POOL_SIZE"]
+    for stats in servers.values():
+        stats["saturation"] = round(stats["checked_out"] / max_pool_size, 3) if max_pool_size else None
+    return {
+        "pid": os.getpid(),
+        "max_pool_size": max_pool_size,
+        "min_pool_size": config["MONGO_MIN_POOL_SIZE"],
+        "wait_queue_timeout_ms": config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        "servers": servers,
+    }
@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+import numpy as np
+from pymongo import ReplaceOne
+from . import history
+
+# One document per ticker holding the latest rolling features plus the
+# short tail of bars needed to roll them forward when new bars arrive.
+COLLECTION = "stock_features"
+WINDOW = 20
+# WINDOW returns need WINDOW + 1 closes
+TAIL = WINDOW + 1
+
+
+def _features_from_tail(ticker, tail):
+    """
+    Computes the latest Return, Vol20 and MA20 from the last TAIL bars
+    (sorted by Date) with the same pandas operations dynamicRisk used on the
+    full history, so the stored values match what it computed.
+    """
+    import pandas as pd
+    tail = tail[-TAIL:]
+    close_norm = pd.Series([bar["Close_norm"] for bar in tail], dtype="float64")
+    returns = close_norm.pct_change()
+    vol20 = returns.rolling(window=WINDOW).std().fillna(0)
+    ma20 = close_norm.rolling(window=WINDOW).mean()
+    latest = tail[-1]
+    return {
+        "Ticker": ticker,
+        "Date": latest["Date"],
+        "Close_norm": float(latest["Close_norm"]),
+        "Volume": float(latest["Volume"]),
+        "Return": None if np.isnan(returns.iloc[-1]) else float(returns.iloc[-1]),
+        "Vol20": float(vol20.iloc[-1]),
+        "MA20": None if np.isnan(ma20.iloc[-1]) else float(ma20.iloc[-1]),
+        "tail": [
+            {"Date": bar["Date"], "Close_norm": float(bar["Close_norm"]), "Volume": float(bar["Volume"])}
+            for bar in tail
+        ],
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def build_features(data):
+    """
+    Builds feature documents for every ticker in a historical DataFrame
+    (columns Ticker, Date, Close_norm, Volume), e.g. the data loaded by
+    market_data_extraction.update_stock_data.
+    """
+    import pandas as pd
+    tails = (
+        data[["Ticker", "Date", "Close_norm", "Volume"]]
+        .sort_values(["Ticker", "Date"])
+        .groupby("Ticker")
+        .tail(TAIL)
+    )
+    docs = []
+    for ticker, group in tails.groupby("Ticker", sort=False):
+        bars = group.to_dict("records")
+        for bar in bars:
+            if isinstance(bar["Date"], pd.Timestamp):
+                bar["Date"] = bar["Date"].to_pydatetime()
+        docs.append(_features_from_tail(ticker, bars))
+    return docs
+
+
+def write_features(db, docs):
+    """Upserts feature documents, one per ticker, in a single bulk write."""
+    if not docs:
+        return
+    db[COLLECTION].bulk_write(
+        [ReplaceOne({"Ticker": doc["Ticker"]}, doc, upsert=True) for doc in docs],
+        ordered=False,
+    )
+
+
+def update_features(db, ticker, new_bars):
+    """
+    Rolls a ticker's features forward with newly arrived bars without
+    touching its history. Falls back to the last TAIL stored bars when the
+    ticker has no feature document yet.
+    """
+    doc = db[COLLECTION].find_one({"Ticker": ticker}, {"tail": 1})
+    if doc:
+        tail = doc["tail"]
+    else:
+        tail = history.tail(db, ticker, TAIL, fields=("Close_norm", "Volume"))
+    last_date = tail[-1]["Date"] if tail else None
+    new_bars = sorted(
+        (bar for bar in new_bars if last_date is None or bar["Date"] > last_date),
+        key=lambda bar: bar["Date"],
+    )
+    tail = tail + new_bars
+    if not tail:
+        return None
+    features = _features_from_tail(ticker, tail)
+    write_features(db, [features])
+    return features
+
+
+def get_features(db, ticker):
+    """Latest feature document for a ticker, computing and storing it on a miss."""
+    doc = db[COLLECTION].find_one({"Ticker": ticker}, {"_id": 0, "tail": 0})
+    if doc is None:
+        doc = update_features(db, ticker, [])
+        if doc is not None:
+            doc = {k: v for k, v in doc.items() if k != "tail"}
+    return doc
@@ -0,0 +1,186 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from pymongo import UpdateOne
+
+# A forecast only changes when a new bar arrives or the model changes, so
+# entries are keyed on (ticker, latest bar Date, model version). The TTL is a
+# safety net; invalidate() is what drops entries after a data load.
+COLLECTION = "forecast_cache"
+
+
+def make_key(ticker, latest_date, model_version):
+    if isinstance(latest_date, datetime):
+        latest_date = latest_date.isoformat()
+    return f"{ticker}|{latest_date}|{model_version}"
+
+
+class MongoCacheBackend:
+    """
+    Shared tier kept in a Mongo collection so several Gunicorn workers reuse
+    each other's forecasts. Expired documents are removed by the TTL index
+    declared in db_indexes.py.
+    """
+
+    def __init__(self, get_db, ttl):
+        self._get_db = get_db
+        self.ttl = ttl
+
+    def get_many(self, keys):
+        now = datetime.now(timezone.utc)
+        docs = self._get_db()[COLLECTION].find(
+            {"_id": {"$in": keys}, "expires_at": {"$gt": now}},
+            {"value": 1}
+        )
+        return {doc["_id"]: doc["value"] for doc in docs}
+
+    def set_many(self, items):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        self._get_db()[COLLECTION].bulk_write([
+            UpdateOne(
+                {"_id": key},
+                {"$set": {"Ticker": key.split("|", 1)[0], "value": value, "expires_at": expires_at}},
+                upsert=True
+            )
+            for key, value in items.items()
+        ], ordered=False)
+
+    def invalidate(self, tickers=None):
+        query = {} if tickers is None else {"Ticker": {"$in": list(tickers)}}
+        self._get_db()[COLLECTION].delete_many(query)
+
+
+class ForecastCache:
+    """
+    In-process LRU with a TTL, optionally backed by a shared tier.
+    Lookups check the local LRU first, then the shared backend, and promote
+    shared hits into the local LRU.
+    """
+
+    def __init__(self, max_entries=1024, ttl=6 * 3600, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "local_hits": 0, "shared_hits": 0, "misses": 0,
+                          "sets": 0, "evictions": 0, "invalidations": 0, "backend_errors": 0}
+
+    def _store_local(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get_many(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+            self._counters["local_hits"] += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.backend is not None:
+            try:
+                shared = self.backend.get_many(missing)
+            except Exception as e:
+                logging.error(f"Shared forecast cache read failed: {e}")
+                shared = {}
+                self._counters["backend_errors"] += 1
+            with self._lock:
+                for key, value in shared.items():
+                    self._store_local(key, value)
+                self._counters["shared_hits"] += len(shared)
+            found.update(shared)
+
+        with self._lock:
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        if not items:
+            return
+        with self._lock:
+            for key, value in items.items():
+                self._store_local(key, value)
+            self._counters["sets"] += len(items)
+        if self.backend is not None:
+            try:
+                self.backend.set_many(items)
+            except Exception as e:
+                logging.error(f"Shared forecast cache write failed: {e}")
+                self._counters["backend_errors"] += 1
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def invalidate(self, tickers=None):
+        """Drops cached forecasts for the given tickers, or everything when tickers is None."""
+        with self._lock:
+            if tickers is None:
+                self._entries.clear()
+            else:
+                prefixes = tuple(f"{ticker}|" for ticker in tickers)
+                for key in [key for key in self._entries if key.startswith(prefixes)]:
+                    del self._entries[key]
+            self._counters["invalidations"] += 1
+        if self.backend is not None:
+            try:
+                self.backend.invalidate(tickers)
+            except Exception as e:
+                logging.error(f"Shared forecast cache invalidation failed: {e}")
+                self._counters["backend_errors"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        stats["max_entries"] = self.max_entries
+        stats["ttl"] = self.ttl
+        stats["shared_backend"] = type(self.backend).__name__ if self.backend is not None else None
+        return stats
+
+
+def _build_cache():
+    from . import connection
+    ttl = int(os.environ.get("FORECAST_CACHE_TTL", 6 * 3600))
+    backend = None
+    if os.environ.get("FORECAST_CACHE_SHARED", "").lower() == "mongo":
+        backend = MongoCacheBackend(connection.get_db, ttl)
+    return ForecastCache(
+        max_entries=int(os.environ.get("FORECAST_CACHE_SIZE", 1024)),
+        ttl=ttl,
+        backend=backend
+    )
+
+
+cache = _build_cache()
+
+
+def invalidate(db, tickers=None):
+    """
+    Drops cached forecasts for the given tickers (all when None) from this
+    process's LRU and from the shared collection, whether or not this process
+    reads through it. Other workers' LRUs miss on their own, since the new
+    bars change the key.
+    """
+    cache.invalidate(tickers)
+    db[COLLECTION].delete_many({} if tickers is None else {"Ticker": {"$in": list(tickers)}})
@@ -0,0 +1,223 @@
+import logging
+from datetime import datetime, timezone
+import numpy as np
+from pymongo import ReplaceOne, UpdateOne
+from . import connection, forecast_cache, history, inference_server, scaling
+from .registry import models
+
+
+WINDOW = 1000
+# Written by the background worker (worker.py), read by the routes
+FORECASTS = "forecasts"
+
+
+def _get_db(db):
+    # Fall back to the shared, pooled client when the caller has no handle
+    return db if db is not None else connection.get_db()
+
+
+def _load_window(db, ticker):
+    """
+    Loads the last WINDOW normalized closes for a ticker.
+    Returns (window, None) on success or (None, (error, status_code)).
+    """
+    historical_data = history.tail(db, ticker, WINDOW)
+    if not historical_data:
+        logging.error(f"No historical data found for ticker {ticker}.")
+        return None, ({"error": f"No historical data found for {ticker}"}, 404)
+
+    if len(historical_data) < WINDOW:
+        logging.error("Not enough historical records for forecasting.")
+        return None, ({"error": "Not enough data (need >= 1000 records)."}, 400)
+
+    if any("Close_norm" not in doc for doc in historical_data):
+        logging.error("Normalized close column missing.")
+        return None, ({"error": "No 'Close_norm' in data."}, 400)
+
+    last_1000_norm = np.array([doc["Close_norm"] for doc in historical_data], dtype="float64")
+    # Quick check for zero variance:
+    if np.allclose(last_1000_norm, last_1000_norm[0]):
+        # e.g., if all 1000 are the same, no real forecast can be made
+        logging.error("No variation in last 10000 days of normalized close.")
+        return None, ({"error": "Last 1000 days have no variation in normalized close."}, 400)
+
+    return last_1000_norm, None
+
+
+def _build_result(predicted_norm, last_1000_norm, scaler=None):
+    """
+    Compares predicted_norm vs. last_norm_close. When the stored close scaler
+    is available, both are also mapped back to prices.
+    """
+    last_norm_close = float(last_1000_norm[-1])
+    result = {
+        "predicted_norm": predicted_norm,
+        "last_norm_close": last_norm_close,
+    }
+    if scaler is not None:
+        result["predicted_close"] = float(scaling.denormalize(predicted_norm, scaler))
+        result["last_close"] = float(scaling.denormalize(last_norm_close, scaler))
+
+    if np.isclose(last_norm_close, 0.0):
+        # avoid dividing by zero
+        result["percent_change"] = None
+        result["warning"] = "Last close_norm is near 0.0; percentage change is meaningless."
+        return result, 200
+
+    #difference = abs(predicted_norm - last_norm_close)
+    result["percent_change"] = (predicted_norm - last_norm_close)/ (last_norm_close * 10)
+    return result, 200
+
+
+def predict_windows(windows):
+    """
+    Runs a single LSTM forward pass over a list of WINDOW-long sequences.
+    Returns one predicted_norm per window, in order.
+    """
+    if not windows:
+        return []
+    remote = inference_server.get_client()
+    if remote is not None:
+        return remote.predict_lstm(windows)
+    # Build input for LSTM: (N, 1000, 1)
+    input_array = np.stack(windows).reshape(len(windows), WINDOW, 1)
+    prediction = models.get("lstm").predict(input_array, batch_size=len(windows), verbose=0)
+    return [float(p[0]) for p in prediction]
+
+
+def _cache_keys(db, tickers):
+    """
+    Maps each ticker to its cache key (ticker, latest bar Date, LSTM version).
+    Tickers without history get no key and are never cached.
+    """
+    model_version = models.version("lstm")
+    latest = history.latest_bars(db, tickers, fields=())
+    return {
+        ticker: forecast_cache.make_key(ticker, bar["Date"], model_version)
+        for ticker, bar in latest.items()
+    }
+
+
+def forecast_ticker(ticker, db=None):
+    """
+    Forecasts the next normalized close for a single ticker.
+    Uses normalized data from the DB, compares predicted_norm vs. last_norm_close.
+    Returns a (result, status_code) tuple so callers can either use the data
+    directly or hand it back as an HTTP response.
+    """
+    db = _get_db(db)
+    key = _cache_keys(db, [ticker]).get(ticker)
+    if key:
+        cached = forecast_cache.cache.get(key)
+        if cached is not None:
+            return cached, 200
+
+    window, error = _load_window(db, ticker)
+    if error:
+        return error
+    predicted_norm = predict_windows([window])[0]
+    result, status = _build_result(predicted_norm, window, scaling.load_close_scaler(db))
+    if key:
+        forecast_cache.cache.set(key, result)
+    return result, status
+
+
+def forecast_tickers(tickers, db=None):
+    """
+    Batch entry point used by the routes in main.py.
+    Serves what it can from the forecast cache, then stacks the windows of the
+    remaining tickers and runs one model call.
+    Returns {ticker: result}; failed forecasts carry an "error" key instead of
+    raising, so one bad ticker does not break a whole page.
+    """
+    db = _get_db(db)
+    unique_tickers = list(dict.fromkeys(tickers))
+
+    results = {}
+    try:
+        keys = _cache_keys(db, unique_tickers)
+        cached = forecast_cache.cache.get_many(list(keys.values()))
+    except Exception as e:
+        logging.error(f"Forecast cache lookup failed: {e}")
+        keys, cached = {}, {}
+    for ticker, key in keys.items():
+        if key in cached:
+            results[ticker] = cached[key]
+
+    windows = {}
+    for ticker in unique_tickers:
+        if ticker in results:
+            continue
+        try:
+            window, error = _load_window(db, ticker)
+        except Exception as e:
+            logging.error(f"Forecast error for {ticker}: {e}")
+            error = ({"error": str(e)}, 500)
+        if error:
+            results[ticker] = error[0]
+        else:
+            windows[ticker] = window
+
+    if windows:
+        try:
+            predictions = predict_windows(list(windows.values()))
+            scaler = scaling.load_close_scaler(db)
+        except Exception as e:
+            logging.error(f"Batch forecast error: {e}")
+            predictions = None
+        fresh = {}
+        for i, (ticker, window) in enumerate(windows.items()):
+            if predictions is None:
+                results[ticker] = {"error": "Model prediction failed."}
+            else:
+                results[ticker], _ = _build_result(predictions[i], window, scaler)
+                if ticker in keys:
+                    fresh[keys[ticker]] = results[ticker]
+        forecast_cache.cache.set_many(fresh)
+
+    # Keep the caller's ticker order
+    return {ticker: results[ticker] for ticker in unique_tickers}
+
+
+def store_forecasts(db, results):
+    """
+    Saves successful forecasts to the forecasts collection, one document per
+    ticker with a timestamp, and copies the headline numbers onto the stocks
+    snapshot so /api/stocks and /api/recommendations get them for free.
+    """
+    now = datetime.now(timezone.utc)
+    model_version = models.version("lstm")
+    forecast_ops = []
+    stock_ops = []
+    for ticker, result in results.items():
+        if "error" in result:
+            continue
+        doc = dict(result, Ticker=ticker, model_version=model_version, computed_at=now)
+        forecast_ops.append(ReplaceOne({"Ticker": ticker}, doc, upsert=True))
+        stock_ops.append(UpdateOne({"Ticker": ticker}, {"$set": {
+            "predicted_close": result.get("predicted_close"),
+            "percent_change": result.get("percent_change"),
+            "forecast_at": now,
+        }}))
+    if forecast_ops:
+        db[FORECASTS].bulk_write(forecast_ops, ordered=False)
+        db["stocks"].bulk_write(stock_ops, ordered=False)
+    return len(forecast_ops)
+
+
+def read_forecasts(tickers, db=None, fallback=True):
+    """
+    Read path for the routes: one indexed $in read of precomputed forecasts.
+    Tickers the worker has not covered yet are forecast live when fallback is
+    set, so pages keep working before the first refresh.
+    """
+    db = _get_db(db)
+    unique_tickers = list(dict.fromkeys(t for t in tickers if t))
+    results = {
+        doc["Ticker"]: doc
+        for doc in db[FORECASTS].find({"Ticker": {"$in": unique_tickers}}, {"_id": 0})
+    }
+    missing = [ticker for ticker in unique_tickers if ticker not in results]
+    if missing and fallback:
+        results.update(forecast_tickers(missing, db=db))
+    return {ticker: results.get(ticker, {"error": "No forecast available."}) for ticker in unique_tickers}
@@ -0,0 +1,43 @@
+COLLECTION = "historical_stocks"
+
+
+def tail(db, ticker, n, fields=("Close_norm",)):
+    """
+    Returns the last n bars of a ticker, oldest first, with only Date and the
+    requested fields. Mongo sorts by Date descending and stops after n
+    documents, so only the window crosses the wire.
+    """
+    projection = {"_id": 0, "Date": 1}
+    projection.update({field: 1 for field in fields})
+    docs = list(
+        db[COLLECTION]
+        .find({"Ticker": ticker}, projection)
+        .sort("Date", -1)
+        .limit(n)
+    )
+    docs.reverse()
+    return docs
+
+
+def latest_bars(db, tickers, fields=("Close",)):
+    """
+    Returns {ticker: {"Date": ..., <fields>}} for the latest bar of every
+    ticker in one aggregation. Sorting in reverse (Ticker, Date) index order
+    lets Mongo pick each ticker's newest bar straight from the index.
+    """
+    tickers = list(dict.fromkeys(t for t in tickers if t))
+    if not tickers:
+        return {}
+    group = {"_id": "$Ticker", "Date": {"$first": "$Date"}}
+    group.update({field: {"$first": f"${field}"} for field in fields})
+    pipeline = [
+        {"$match": {"Ticker": {"$in": tickers}}},
+        {"$sort": {"Ticker": -1, "Date": -1}},
+        {"$group": group},
+    ]
+    return {doc.pop("_id"): doc for doc in db[COLLECTION].aggregate(pipeline)}
+
+
+def latest_closes(db, tickers):
+    """Returns {ticker: Close} of the latest bar of every ticker."""
+    return {ticker: bar["Close"] for ticker, bar in latest_bars(db, tickers).items()}
@@ -0,0 +1,222 @@
+"""
+Inference server: one process (or a few) owns the models and serves
+predictions to the web workers over a local socket, so web workers never
+import TensorFlow and CPU-heavy predicts do not stall request handling.
+
+    python -m modelAI.inference_server --address 127.0.0.1:6001
+
+Web workers use it when INFERENCE_SERVER is set, e.g.
+INFERENCE_SERVER=127.0.0.1:6001 (or several comma-separated addresses,
+spread over by worker pid). Concurrent requests are micro-batched: the
+server waits up to --window-ms after the first request to collect more,
+then runs one predict per model for the whole batch.
+
+Requests are pickled, so whoever passes the handshake can run code in the
+server: both sides need the same INFERENCE_AUTHKEY secret and neither starts
+without it. A client gives up on a reply after INFERENCE_TIMEOUT seconds.
+"""
+import os
+import sys
+import queue
+import logging
+import argparse
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", 10))
+
+
+def _authkey():
+    """The handshake secret from INFERENCE_AUTHKEY; there is deliberately no default."""
+    key = os.environ.get("INFERENCE_AUTHKEY")
+    if not key:
+        raise RuntimeError("INFERENCE_AUTHKEY is not set; the inference server and the web workers "
+                           "need the same secret to connect.")
+    return key.encode()
+
+
+def _parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+# ---------------------------
+# Server
+# ---------------------------
+class _Request:
+    __slots__ = ("kind", "rows", "event", "result", "error")
+
+    def __init__(self, kind, rows):
+        self.kind = kind
+        self.rows = rows
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _predict(kind, rows):
+    from .registry import models
+    if kind == "lstm":
+        prediction = models.get("lstm").predict(rows.reshape(len(rows), -1, 1), batch_size=len(rows), verbose=0)
+        return np.asarray(prediction)[:, 0]
+    if kind == "risk":
+        return np.asarray(models.get("xgb_multiclass").predict(rows))
+    raise ValueError(f"Unknown model kind '{kind}'.")
+
+
+class InferenceServer:
+    def __init__(self, address, window_ms=5.0, max_batch=256):
+        self.address = _parse_address(address)
+        self.authkey = _authkey()
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+
+    def _collect(self):
+        """Blocks for one request, then gathers more for up to the batching window."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        size = len(batch[0].rows)
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.rows)
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect()
+            by_kind = {}
+            for request in batch:
+                by_kind.setdefault(request.kind, []).append(request)
+            for kind, requests in by_kind.items():
+                try:
+                    predictions = _predict(kind, np.concatenate([r.rows for r in requests]))
+                    offset = 0
+                    for r in requests:
+                        r.result = predictions[offset:offset + len(r.rows)]
+                        offset += len(r.rows)
+                except Exception as e:
+                    logging.error(f"Batch predict failed for '{kind}': {e}")
+                    for r in requests:
+                        r.error = str(e)
+                for r in requests:
+                    r.event.set()
+            self.batches += 1
+            self.requests += len(batch)
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    kind, rows = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if kind == "versions":
+                    from .registry import models
+                    conn.send(("ok", models.versions()))
+                    continue
+                if kind == "stats":
+                    conn.send(("ok", {"batches": self.batches, "requests": self.requests}))
+                    continue
+                request = _Request(kind, np.asarray(rows, dtype="float64"))
+                self._queue.put(request)
+                request.event.wait()
+                conn.send(("error", request.error) if request.error else ("ok", request.result))
+
+    def serve_forever(self):
+        from .registry import models
+        models.load_all()
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        with Listener(self.address, backlog=64, authkey=self.authkey) as listener:
+            logging.info(f"Inference server listening on {self.address[0]}:{self.address[1]}.")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    # A client that fails or drops the handshake must not stop the server
+                    logging.error(f"Rejected inference connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+# ---------------------------
+# Client
+# ---------------------------
+class InferenceClient:
+    """One connection per thread; requests on a connection are sequential."""
+
+    def __init__(self, address, timeout=TIMEOUT):
+        self.address = _parse_address(address)
+        self.authkey = _authkey()
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _call(self, kind, payload):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send((kind, payload))
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"No reply from the inference server within {self.timeout:g} s.")
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # Server restarted or stuck: drop the connection, so the next call reconnects
+            # and a late reply is never read as the answer to another request
+            conn.close()
+            self._local.conn = None
+            raise
+        if status != "ok":
+            raise RuntimeError(f"Inference server error: {result}")
+        return result
+
+    def predict_lstm(self, windows):
+        return [float(p) for p in self._call("lstm", np.asarray(windows, dtype="float64"))]
+
+    def predict_risk(self, rows):
+        return list(self._call("risk", np.asarray(rows, dtype="float64")))
+
+    def versions(self):
+        return self._call("versions", None)
+
+
+_client = None
+_client_pid = None
+
+
+def get_client():
+    """The InferenceClient for this process, or None when INFERENCE_SERVER is not set."""
+    global _client, _client_pid
+    addresses = [a for a in os.environ.get("INFERENCE_SERVER", "").split(",") if a]
+    if not addresses:
+        return None
+    if _client is None or _client_pid != os.getpid():
+        _client_pid = os.getpid()
+        _client = InferenceClient(addresses[_client_pid % len(addresses)])
+    return _client
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Serve model predictions to the web workers.")
+    parser.add_argument("--address", default="127.0.0.1:6001")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="how long to collect requests into one batch")
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+    try:
+        server = InferenceServer(args.address, window_ms=args.window_ms, max_batch=args.max_batch)
+    except RuntimeError as e:
+        sys.exit(f"Refusing to start: {e}")
+    server.serve_forever()
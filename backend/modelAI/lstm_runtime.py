@@ -0,0 +1,124 @@
+"""
+Lightweight CPU runtimes for the LSTM. Keras pays a large fixed cost per
+predict() call (graph dispatch, input adaptation), which dominates the
+latency of a single 1000-step window. The model can be exported once to
+TFLite or ONNX and served by the matching runtime instead:
+
+    python -m modelAI.lstm_runtime --format tflite
+    python -m modelAI.lstm_runtime --format onnx
+
+and then selected with LSTM_BACKEND=tflite|onnx (default keras). Both
+wrappers expose the same predict(x, batch_size=None, verbose=0) as the Keras
+model, so callers do not change. bench_lstm_backends.py checks parity with
+Keras and compares latency.
+"""
+import os
+import logging
+import argparse
+import threading
+import numpy as np
+
+MODEL_DIR = os.path.dirname(__file__)
+WINDOW = 1000
+KERAS_FILE = "final_lstm_model.h5"
+EXPORT_FILES = {"tflite": "final_lstm_model.tflite", "onnx": "final_lstm_model.onnx"}
+# Intra-op threads for the runtimes; unset lets each runtime pick
+NUM_THREADS = int(os.environ["LSTM_NUM_THREADS"]) if os.environ.get("LSTM_NUM_THREADS") else None
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter behind a Keras-like predict(). Uses the standalone
+    tflite_runtime package when installed, so serving does not need
+    TensorFlow. The interpreter is not thread-safe and holds one input
+    shape at a time, so calls are serialized and the input is only resized
+    when the batch size changes.
+    """
+
+    def __init__(self, path, num_threads=NUM_THREADS):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]["index"]
+        self._output = self._interpreter.get_output_details()[0]["index"]
+        self._shape = tuple(self._interpreter.get_input_details()[0]["shape"])
+        self._lock = threading.Lock()
+
+    def predict(self, x, batch_size=None, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if x.shape != self._shape:
+                self._interpreter.resize_tensor_input(self._input, x.shape)
+                self._interpreter.allocate_tensors()
+                self._shape = x.shape
+            self._interpreter.set_tensor(self._input, x)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output).copy()
+
+
+class OnnxModel:
+    """ONNX Runtime CPU session behind a Keras-like predict(). Sessions are thread-safe."""
+
+    def __init__(self, path, num_threads=NUM_THREADS):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input = self._session.get_inputs()[0].name
+
+    def predict(self, x, batch_size=None, verbose=0):
+        return self._session.run(None, {self._input: np.asarray(x, dtype=np.float32)})[0]
+
+
+def load_tflite(path):
+    return TFLiteModel(path)
+
+
+def load_onnx(path):
+    return OnnxModel(path)
+
+
+# ---------------------------
+# Export
+# ---------------------------
+def export(fmt, source=None, output=None):
+    """
+    Converts the Keras LSTM to fmt ("tflite" or "onnx") with a dynamic batch
+    dimension, so batched forecasts keep working. Needs TensorFlow (and
+    tf2onnx for ONNX); only this step does. Returns the output path.
+    """
+    import tensorflow as tf
+    from .registry import load_keras
+
+    source = source or os.path.join(MODEL_DIR, KERAS_FILE)
+    output = output or os.path.join(MODEL_DIR, EXPORT_FILES[fmt])
+    model = load_keras(source)
+    signature = (tf.TensorSpec((None, WINDOW, 1), tf.float32, name="window"),)
+
+    if fmt == "tflite":
+        # Trace with a dynamic batch so the interpreter can be resized per call
+        concrete = tf.function(model).get_concrete_function(*signature)
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+        with open(output, "wb") as f:
+            f.write(converter.convert())
+    elif fmt == "onnx":
+        import tf2onnx
+        tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=output)
+    else:
+        raise ValueError(f"Unknown export format '{fmt}'.")
+    logging.info(f"Exported {os.path.basename(source)} to {output}.")
+    return output
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export the Keras LSTM for a lightweight CPU runtime.")
+    parser.add_argument("--format", choices=sorted(EXPORT_FILES), required=True)
+    parser.add_argument("--source", default=None, help=f"Keras model (default {KERAS_FILE})")
+    parser.add_argument("--output", default=None, help="output file (default next to the Keras model)")
+    args = parser.parse_args()
+    print(export(args.format, source=args.source, output=args.output))
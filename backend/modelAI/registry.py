@@ -0,0 +1,186 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from . import lstm_runtime
+
+MODEL_DIR = os.path.dirname(__file__)
+
+
+def load_keras(path):
+    import tensorflow as tf
+    return tf.keras.models.load_model(
+        path,
+        custom_objects={'mse': tf.keras.losses.MeanSquaredError()}
+    )
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def file_version(path):
+    """Short content hash, so a model copied over with an old mtime still gets a new version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """
+    Holds every model in memory together with its version and file mtime.
+    get() re-stats the file at most every check_interval seconds and, when it
+    changed on disk, loads the new file and swaps it in with a single
+    reference assignment, so readers always see a complete model.
+    """
+
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._specs = {}
+        self._entries = {}
+        self._last_check = {}
+        self._file_versions = {}
+        self._errors = {}
+        self._required = set()
+        self._warm_thread = None
+        self._lock = threading.Lock()
+
+    def register(self, name, filename, loader, required=True):
+        """Models are loaded lazily on first get(); required ones gate readiness."""
+        self._specs[name] = (os.path.join(MODEL_DIR, filename), loader)
+        if required:
+            self._required.add(name)
+
+    def _load(self, name):
+        path, loader = self._specs[name]
+        mtime = os.path.getmtime(path)
+        model = loader(path)
+        entry = {
+            "model": model,
+            "path": path,
+            "version": file_version(path),
+            "mtime": mtime,
+            "loaded_at": time.time(),
+        }
+        self._entries[name] = entry
+        self._errors.pop(name, None)
+        logging.info(f"Model '{name}' loaded (version {entry['version']}).")
+        return entry
+
+    def _refresh(self, name):
+        now = time.monotonic()
+        entry = self._entries.get(name)
+        if entry is not None and now - self._last_check.get(name, 0) < self.check_interval:
+            return entry
+        with self._lock:
+            entry = self._entries.get(name)
+            self._last_check[name] = now
+            path, _ = self._specs[name]
+            try:
+                if entry is None or os.path.getmtime(path) != entry["mtime"]:
+                    entry = self._load(name)
+            except Exception as e:
+                # Keep serving the previous model if the new file is broken or half-written
+                logging.error(f"Could not load model '{name}': {e}")
+                self._errors[name] = str(e)
+                if entry is None:
+                    raise
+            return entry
+
+    def get(self, name):
+        return self._refresh(name)["model"]
+
+    def version(self, name):
+        """
+        Version of the model in use. A process that never loads the model
+        (e.g. a web worker talking to the inference server) gets the version
+        of the file on disk instead, without loading it.
+        """
+        if name in self._entries:
+            return self._refresh(name)["version"]
+        return self.file_version(name)
+
+    def file_version(self, name):
+        """Version of the model file on disk, rehashed only when its mtime changes."""
+        path, _ = self._specs[name]
+        mtime = os.path.getmtime(path)
+        cached = self._file_versions.get(name)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, file_version(path))
+            self._file_versions[name] = cached
+        return cached[1]
+
+    def load_all(self):
+        """Loads every registered model; a model that fails to load is logged, not fatal."""
+        for name in self._specs:
+            try:
+                self._refresh(name)
+            except Exception:
+                pass
+
+    def warm_up(self, background=True):
+        """
+        Loads every model ahead of the first request. In the background the
+        process starts serving non-ML routes immediately; ready() reports
+        when the models are in.
+        """
+        if not background:
+            self.load_all()
+            return
+        with self._lock:
+            if self._warm_thread is None:
+                self._warm_thread = threading.Thread(target=self.load_all, name="model-warm-up", daemon=True)
+                self._warm_thread.start()
+
+    def ready(self):
+        return all(name in self._entries for name in self._required)
+
+    def status(self):
+        models = {}
+        for name in self._specs:
+            if name in self._entries:
+                models[name] = "loaded"
+            elif name in self._errors:
+                models[name] = "failed"
+            else:
+                models[name] = "pending"
+        warming = self._warm_thread is not None and self._warm_thread.is_alive()
+        return {"ready": self.ready(), "warming": warming, "models": models}
+
+    def versions(self):
+        result = {}
+        for name, (path, _) in self._specs.items():
+            entry = self._entries.get(name)
+            if entry is None:
+                result[name] = {"path": os.path.basename(path), "loaded": False}
+            else:
+                result[name] = {
+                    "path": os.path.basename(path),
+                    "loaded": True,
+                    "version": entry["version"],
+                    "mtime": entry["mtime"],
+                    "loaded_at": entry["loaded_at"],
+                }
+        return result
+
+
+models = ModelRegistry(check_interval=float(os.environ.get("MODEL_RELOAD_CHECK_INTERVAL", 5.0)))
+# LSTM_BACKEND=tflite|onnx serves an exported copy (see lstm_runtime.py) instead of Keras
+LSTM_BACKENDS = {
+    "keras": (lstm_runtime.KERAS_FILE, load_keras),
+    "tflite": (lstm_runtime.EXPORT_FILES["tflite"], lstm_runtime.load_tflite),
+    "onnx": (lstm_runtime.EXPORT_FILES["onnx"], lstm_runtime.load_onnx),
+}
+LSTM_BACKEND = os.environ.get("LSTM_BACKEND", "keras").lower()
+if LSTM_BACKEND not in LSTM_BACKENDS:
+    raise ValueError(f"Unknown LSTM_BACKEND '{LSTM_BACKEND}', expected one of {sorted(LSTM_BACKENDS)}.")
+models.register("lstm", *LSTM_BACKENDS[LSTM_BACKEND])
+models.register("xgb", "xgb_model.pkl", load_pickle)
+models.register("xgb_multiclass", "xgb_model_multiclass_good.pkl", load_pickle)
+# Not used for scoring (it does not load cleanly), so it does not gate readiness
+models.register("lgb", "lgb_model.pkl", load_pickle, required=False)
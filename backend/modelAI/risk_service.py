@@ -0,0 +1,70 @@
+import numpy as np
+from . import connection, features, inference_server
+from .registry import models
+
+EXPLANATIONS = {
+    1: ("Very Low Risk",
+        "The model indicates that this stock has very low volatility, stable volume, and strong market capitalization. "
+        "Such stocks are generally considered very safe with minimal price fluctuations."),
+    2: ("Low Risk",
+        "This stock appears to have low volatility and stable trading activity with a solid market cap, suggesting relatively low risk. "
+        "It may offer modest returns with little downside."),
+    3: ("Moderate Risk",
+        "The risk assessment shows moderate volatility and trading volume. "
+        "This stock exhibits average risk characteristics; it might offer balanced potential for both gains and losses."),
+    4: ("High Risk",
+        "The stock is characterized by high volatility and increased trading volume, indicating potential for significant price swings. "
+        "Investors should exercise caution, as the risk of loss is higher."),
+    5: ("Very High Risk",
+        "The model classifies this stock as very high risk due to extremely high volatility and abnormal trading volume. "
+        "Such stocks can experience dramatic price fluctuations, making them very unpredictable and risky for investment.")
+}
+
+
+def explain(risk_class):
+    """Maps a risk class 1-5 to its (overall_risk, detailed_explanation) pair."""
+    return EXPLANATIONS.get(
+        risk_class,
+        ("Unknown", "Risk assessment could not be determined.")
+    )
+
+
+def risk_classes(feature_docs):
+    """
+    Scores many feature documents with a single model call.
+    Returns one risk class (1-5) per document, in order.
+    """
+    if not feature_docs:
+        return []
+    feature_rows = np.array([[doc["Volume"], doc["Vol20"], doc["Close_norm"]] for doc in feature_docs])
+
+    remote = inference_server.get_client()
+    if remote is not None:
+        return [int(pred) + 1 for pred in remote.predict_risk(feature_rows)]
+
+    # This is functional ("lgb" isn't working -> trained on 1000 stocks)
+    xgb_model_mc = models.get("xgb_multiclass")
+
+    return [int(pred) + 1 for pred in xgb_model_mc.predict(feature_rows)]
+
+
+def assess_ticker(ticker, db=None):
+    """
+    Scores a ticker from its stored rolling features: one indexed lookup in the
+    feature store plus one model call, instead of a pass over the full history.
+    Returns a (result, status_code) tuple.
+    """
+    if db is None:
+        db = connection.get_db()
+    latest = features.get_features(db, ticker)
+    if not latest:
+        return {"error": "No historical data found for this ticker."}, 404
+
+    risk_class = risk_classes([latest])[0]
+    overall_risk, detailed_explanation = explain(risk_class)
+
+    return {
+        "risk_class": risk_class,
+        "overall_risk": overall_risk,
+        "detailed_explanation": detailed_explanation
+    }, 200
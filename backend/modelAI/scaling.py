@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from .registry import models
+
+# Close -> Close_norm is a global min-max scaling fitted over every stock and
+# ETF at load time. Its parameters live in the metadata collection so new bars
+# can be normalized, and predictions mapped back to prices, without history.
+COLLECTION = "metadata"
+SCALER_ID = "close_scaler"
+
+
+def fit_close_scaler(close_min, close_max):
+    """Same parameters as MinMaxScaler(feature_range=(0, 1)) fitted on [close_min, close_max]."""
+    data_range = close_max - close_min
+    scale = 1.0 / data_range if data_range != 0 else 1.0
+    return {"data_min": close_min, "data_max": close_max, "scale": scale, "offset": -close_min * scale}
+
+
+def save_close_scaler(db, scaler):
+    """Stores the scaler with a bumped version and the LSTM file version it was fitted for."""
+    previous = db[COLLECTION].find_one({"_id": SCALER_ID}, {"version": 1})
+    doc = dict(scaler)
+    doc.update({
+        "_id": SCALER_ID,
+        "scope": "global",
+        "version": (previous or {}).get("version", 0) + 1,
+        "model_version": models.file_version("lstm"),
+        "fitted_at": datetime.now(timezone.utc),
+    })
+    db[COLLECTION].replace_one({"_id": SCALER_ID}, doc, upsert=True)
+    return doc
+
+
+def load_close_scaler(db):
+    return db[COLLECTION].find_one({"_id": SCALER_ID})
+
+
+def normalize(close, scaler):
+    # Same operation order as MinMaxScaler.transform: X * scale_ + min_
+    return close * scaler["scale"] + scaler["offset"]
+
+
+def denormalize(close_norm, scaler):
+    return (close_norm - scaler["offset"]) / scaler["scale"]
@@ -0,0 +1,161 @@
+# portfolio_summary.py
+"""
+Materialized per-user portfolio valuation behind /api/portfolio: one
+document per user (keyed on the user id) with every position's price,
+forecast and predicted P/L plus the totals, so a read is a single fetch.
+
+- get() returns the stored summary, building it on a miss.
+- apply_purchase() folds a purchase into the stored summary using the
+  price and forecast already stored in it; nothing is looked up again.
+- invalidate() drops the summaries holding given tickers (or all of them)
+  when prices or forecasts change; they are rebuilt on the next read.
+
+Each summary carries a version. purchase() replaces it only if the version
+is unchanged, and a summary that is still being built is abandoned by a
+concurrent purchase, so a stale valuation is never stored.
+"""
+from bson import ObjectId
+import fanout
+from modelAI import forecast_service, history
+
+COLLECTION = "portfolio_summaries"
+# Added to every predicted close when computing P/L, as /api/portfolio always has
+PL_OFFSET = 10
+
+
+def _position(ticker, quantity, average_cost, current_price, predicted_close, company_name=None):
+    return {
+        "ticker": ticker,
+        "company_name": company_name or ticker,
+        "quantity": quantity,
+        "average_cost": average_cost,
+        "current_price": current_price,
+        "predicted_close": predicted_close,
+        "profit_loss": (predicted_close - average_cost + PL_OFFSET) * quantity,
+    }
+
+
+def _with_totals(positions):
+    return {
+        "positions": positions,
+        "tickers": [p["ticker"] for p in positions],
+        "total_value": sum(p["current_price"] * p["quantity"] for p in positions),
+        "cost_basis": sum(p["average_cost"] * p["quantity"] for p in positions),
+        "total_profit_loss": sum(p["profit_loss"] for p in positions),
+    }
+
+
+def compute(db, user_id):
+    """Values a portfolio from scratch: one price query and one forecast read, run concurrently."""
+    holdings = list(db.portfolios.find({"user_id": user_id}))
+    tickers = [item.get("ticker") for item in holdings]
+    latest_prices, forecasts = fanout.run_concurrently([
+        (history.latest_closes, db, tickers),
+        (forecast_service.read_forecasts, tickers, db),
+    ])
+    positions = []
+    for item in holdings:
+        ticker = item.get("ticker")
+        current_price = float(latest_prices.get(ticker, 0.0))
+        forecast = forecasts.get(ticker, {})
+        if "error" in forecast:
+            print(f"Forecast failed for {ticker}: {forecast['error']}")
+        predicted_close = current_price if "error" in forecast else forecast.get("predicted_close", current_price)
+        positions.append(_position(
+            ticker, item.get("quantity", 0), item.get("average_cost", 0.0),
+            current_price, predicted_close, item.get("company_name")
+        ))
+    return _with_totals(positions)
+
+
+def get(db, user_id):
+    """The user's summary: the stored document, or a fresh build that is stored for the next read."""
+    doc = db[COLLECTION].find_one({"_id": user_id})
+    if doc is not None and doc.get("complete"):
+        return doc
+
+    # Claim the build; a purchase that lands meanwhile clears the token and the result is not stored
+    token = ObjectId()
+    db[COLLECTION].update_one(
+        {"_id": user_id},
+        {"$set": {"building": token, "complete": False}},
+        upsert=True
+    )
+    summary = compute(db, user_id)
+    summary.update({"_id": user_id, "complete": True, "version": 0})
+    db[COLLECTION].replace_one({"_id": user_id, "building": token}, summary)
+    return summary
+
+
+def apply_purchase(db, user_id, ticker, quantity, price, stock_record):
+    """
+    Adds a purchase of quantity shares at price to the stored summary.
+    A new position takes its price and forecast from stock_record (the
+    stocks snapshot, which carries the precomputed predicted_close); when
+    there is no summary, or no forecast for a new ticker, the summary is
+    dropped instead and rebuilt on the next read.
+    """
+    doc = db[COLLECTION].find_one({"_id": user_id})
+    if doc is None or not doc.get("complete"):
+        # Abandon a build in progress: it read the holdings before this purchase
+        db[COLLECTION].update_one({"_id": user_id}, {"$unset": {"building": ""}})
+        return False
+
+    positions = doc["positions"]
+    existing = next((p for p in positions if p["ticker"] == ticker), None)
+    if existing is not None:
+        new_quantity = existing["quantity"] + quantity
+        new_average = (existing["average_cost"] * existing["quantity"] + price * quantity) / new_quantity
+        updated = _position(ticker, new_quantity, new_average, existing["current_price"],
+                            existing["predicted_close"], existing.get("company_name"))
+        positions = [updated if p["ticker"] == ticker else p for p in positions]
+    elif stock_record.get("predicted_close") is not None and stock_record.get("Close") is not None:
+        positions = positions + [_position(
+            ticker, quantity, price, float(stock_record["Close"]),
+            float(stock_record["predicted_close"])
+        )]
+    else:
+        db[COLLECTION].delete_one({"_id": user_id})
+        return False
+
+    summary = _with_totals(positions)
+    summary.update({"_id": user_id, "complete": True, "version": doc.get("version", 0) + 1})
+    result = db[COLLECTION].replace_one({"_id": user_id, "version": doc.get("version", 0)}, summary)
+    if result.matched_count == 0:
+        # Changed or invalidated concurrently: rebuild on the next read
+        db[COLLECTION].delete_one({"_id": user_id})
+        return False
+    return True
+
+
+def invalidate(db, tickers=None):
+    """
+    Drops every summary holding one of tickers (all summaries when None),
+    and any build in progress, which may have read the old values.
+    """
+    query = {} if tickers is None else {"$or": [{"tickers": {"$in": list(tickers)}}, {"complete": False}]}
+    return db[COLLECTION].delete_many(query).deleted_count
+
+
+def to_response(summary):
+    """The /api/portfolio payload for a stored summary."""
+    items = [
+        {
+            "ticker": p["ticker"],
+            "company_name": p["company_name"],
+            "quantity": p["quantity"],
+            "average_cost": round(p["average_cost"], 2),
+            "current_price": round(p["current_price"], 2),
+            "predicted_future_price": round(p["current_price"] + p["profit_loss"], 2),
+            "profit_loss": round(p["profit_loss"], 2),
+        }
+        for p in summary["positions"]
+    ]
+    return {
+        "portfolio": items,
+        "summary": {
+            "total_value": round(summary["total_value"], 2),
+            "cost_basis": round(summary["cost_basis"], 2),
+            "total_profit_loss": round(summary["total_profit_loss"], 2),
+        },
+    }
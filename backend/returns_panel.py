@@ -0,0 +1,212 @@
+# returns_panel.py
+"""
+Array-backed daily returns of every stored ticker, for portfolio analytics
+(mean-variance weights in allocation.py, /api/rebalance) without going back
+to historical_stocks per request.
+
+    python returns_panel.py [--lookback 252]
+
+Rebuilt after every data load (market_data_extraction.py). A build writes
+    returns.npy   float32 (tickers x dates) simple daily returns over the last
+                  lookback dates, NaN where a ticker did not trade
+    mean.npy      float64 (tickers,) mean daily return over the same dates
+    cov.npy       float64 (tickers x tickers) covariance over the same dates
+    meta.json     tickers, dates, lookback, built_at
+into a fresh directory under RETURNS_PANEL_DIR (default data/returns_panel)
+and then points CURRENT at it, so readers never see half a build. Readers
+memory-map returns.npy and reload when CURRENT changes.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone, timedelta
+import numpy as np
+
+PANEL_DIR = os.environ.get(
+    "RETURNS_PANEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "returns_panel")
+)
+POINTER = "CURRENT"
+# Trading days the cached mean and covariance cover
+LOOKBACK = 252
+# A ticker needs this many returns in the lookback to get a covariance row
+MIN_PERIODS = 20
+# Seconds between checks of CURRENT for a newer build
+CHECK_INTERVAL = float(os.environ.get("RETURNS_PANEL_CHECK_INTERVAL", 5.0))
+
+
+class Panel:
+    """One build of the panel: memory-mapped returns plus the cached moments."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.path = path
+        self.tickers = meta["tickers"]
+        self.dates = meta["dates"]
+        self.lookback = meta["lookback"]
+        self.built_at = meta["built_at"]
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.returns = np.load(os.path.join(path, "returns.npy"), mmap_mode="r")
+        self.mean = np.load(os.path.join(path, "mean.npy"))
+        self.cov = np.load(os.path.join(path, "cov.npy"))
+
+    def moments(self, tickers):
+        """
+        (present, mean, cov) for the tickers the panel knows, in the order
+        given; present is a boolean mask over tickers.
+        """
+        rows = np.array([self.index.get(ticker, -1) for ticker in tickers], dtype=np.int64)
+        present = rows >= 0
+        rows = rows[present]
+        return present, self.mean[rows], self.cov[np.ix_(rows, rows)]
+
+
+# ---------------------------
+# Build
+# ---------------------------
+def _close_matrix(db, lookback=LOOKBACK):
+    """
+    (tickers, dates, closes) over the last lookback + 1 trading dates, with
+    closes a (tickers x dates) float64 array, NaN where missing. Reads one
+    projected cursor bounded by Date and sorted in (Ticker, Date) index
+    order, so only the window crosses the wire, not the whole history.
+    """
+    from modelAI import history
+    tickers = sorted(db[history.COLLECTION].distinct("Ticker"))
+    latest = history.latest_bars(db, tickers, fields=())
+    if not latest:
+        return [], [], np.empty((0, 0))
+    end = max(bar["Date"] for bar in latest.values())
+    # Calendar days that comfortably cover lookback + 1 trading days
+    start = end - timedelta(days=int((lookback + 1) * 1.5) + 10)
+    cursor = db[history.COLLECTION].find(
+        {"Ticker": {"$in": tickers}, "Date": {"$gte": start}},
+        {"_id": 0, "Ticker": 1, "Date": 1, "Close": 1},
+    ).sort([("Ticker", 1), ("Date", 1)])
+    bars = [(doc["Ticker"], doc["Date"], doc.get("Close")) for doc in cursor]
+
+    dates = sorted({date for _, date, _ in bars})[-(lookback + 1):]
+    tickers = sorted({ticker for ticker, date, close in bars if close is not None and date >= dates[0]})
+    rows = {ticker: i for i, ticker in enumerate(tickers)}
+    columns = {date: j for j, date in enumerate(dates)}
+    closes = np.full((len(tickers), len(dates)), np.nan)
+    for ticker, date, close in bars:
+        if close is not None and date in columns:
+            closes[rows[ticker], columns[date]] = close
+    return tickers, dates, closes
+
+
+def compute_moments(returns, lookback=LOOKBACK, min_periods=MIN_PERIODS):
+    """
+    Mean and covariance of each ticker's returns over the last lookback
+    dates. Missing returns count as zero for the pairwise sums; tickers with
+    fewer than min_periods returns get a zero mean and only their own
+    variance, so they never look attractive on no data.
+    """
+    window = np.asarray(returns[:, -lookback:], dtype=np.float64)
+    observed = ~np.isnan(window)
+    counts = observed.sum(axis=1)
+    filled = np.where(observed, window, 0.0)
+    mean = np.divide(filled.sum(axis=1), counts, out=np.zeros(len(counts)), where=counts > 0)
+    centered = np.where(observed, window - mean[:, None], 0.0)
+    pairs = observed.astype(np.float64) @ observed.T.astype(np.float64)
+    cov = np.divide(centered @ centered.T, pairs - 1, out=np.zeros_like(pairs), where=pairs > 1)
+    thin = counts < min_periods
+    mean[thin] = 0.0
+    cov[thin, :] = 0.0
+    cov[:, thin] = 0.0
+    variances = np.divide((centered ** 2).sum(axis=1), counts - 1, out=np.zeros(len(counts)), where=counts > 1)
+    cov[np.diag_indices_from(cov)] = variances
+    return mean, cov
+
+
+def build(db, lookback=LOOKBACK, panel_dir=PANEL_DIR):
+    """
+    Builds a new panel from the last lookback dates of historical_stocks and
+    makes it current. Returns its directory.
+    """
+    tickers, dates, closes = _close_matrix(db, lookback)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = (closes[:, 1:] / closes[:, :-1] - 1).astype(np.float32)
+    returns[~np.isfinite(returns)] = np.nan
+    return write(tickers, [d.isoformat() for d in dates[1:]], returns, lookback, panel_dir)
+
+
+def write(tickers, dates, returns, lookback=LOOKBACK, panel_dir=PANEL_DIR):
+    """Saves a (tickers x dates) returns array and its moments as a new build and makes it current."""
+    mean, cov = compute_moments(returns, lookback)
+    os.makedirs(panel_dir, exist_ok=True)
+    name = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(panel_dir, name)
+    os.makedirs(path)
+    np.save(os.path.join(path, "returns.npy"), returns)
+    np.save(os.path.join(path, "mean.npy"), mean)
+    np.save(os.path.join(path, "cov.npy"), cov)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({
+            "tickers": tickers,
+            "dates": list(dates),
+            "lookback": lookback,
+            "built_at": datetime.now(timezone.utc).isoformat(),
+        }, f)
+
+    # Point CURRENT at the new build atomically, then drop all but the previous build
+    pointer_tmp = os.path.join(panel_dir, POINTER + ".tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+    previous = _current_name(panel_dir)
+    os.replace(pointer_tmp, os.path.join(panel_dir, POINTER))
+    for entry in os.listdir(panel_dir):
+        if entry not in (name, previous, POINTER) and os.path.isdir(os.path.join(panel_dir, entry)):
+            shutil.rmtree(os.path.join(panel_dir, entry), ignore_errors=True)
+    logging.info(f"Returns panel {name}: {len(tickers)} tickers x {returns.shape[1]} dates.")
+    return path
+
+
+# ---------------------------
+# Read
+# ---------------------------
+def _current_name(panel_dir=PANEL_DIR):
+    try:
+        with open(os.path.join(panel_dir, POINTER)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+_panel = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def get_panel():
+    """The current panel, or None before the first build. Checks for a newer build every CHECK_INTERVAL seconds."""
+    global _panel, _last_check
+    now = time.monotonic()
+    if _panel is not None and now - _last_check < CHECK_INTERVAL:
+        return _panel
+    with _lock:
+        _last_check = now
+        name = _current_name()
+        if name is None:
+            return _panel
+        if _panel is None or os.path.basename(_panel.path) != name:
+            try:
+                _panel = Panel(os.path.join(PANEL_DIR, name))
+            except Exception as e:
+                # Keep the previous build if the new one cannot be read
+                logging.error(f"Could not load returns panel {name}: {e}")
+        return _panel
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild the returns panel from historical_stocks.")
+    parser.add_argument("--lookback", type=int, default=LOOKBACK, help="trading days for the cached mean/covariance")
+    args = parser.parse_args()
+    from modelAI import connection
+    print(build(connection.get_db(), lookback=args.lookback))
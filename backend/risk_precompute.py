@@ -1,23 +1,80 @@
-from pymongo import MongoClient
-import requests
+# risk_precompute.py
+"""
+Scores every ticker in "stocks" and stores its risk_class.
 
-client = MongoClient("mongodb://localhost:27017")
-db = client["stock_optimizer"]
+    python risk_precompute.py [--workers N]
 
-stocks_collection = db["stocks"]
+Features come from the stock_features store in one query; tickers missing
+from it are rebuilt from their history tail (in a process pool with
+--workers > 1). All tickers are then scored with one model call and written
+back with one bulk_write.
+"""
+import time
+import argparse
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from modelAI import connection, features, risk_service
 
-stocks = list(stocks_collection.find({}, {"Ticker": 1}))
 
-for s in stocks:
-    ticker = s["Ticker"]
-    try:
-        resp = requests.get("http://localhost:5000/api/model/dynamicRisk", params={"ticker": ticker})
-        if resp.status_code == 200:
-            print(f"Extrac dynamicRisk for {ticker}")
-            data = resp.json()
-            risk_class = data.get("risk_class", 3)
-            stocks_collection.update_one({"Ticker": ticker}, {"$set": {"risk_class": risk_class}})
-    except Exception as e:
-        print(f"Error computing risk for {ticker}: {e}")
+def _build_features(ticker, db=None):
+    # In pool worker processes db is None and connection.get_db() opens a client per process
+    doc = features.update_features(db if db is not None else connection.get_db(), ticker, [])
+    if doc is not None:
+        doc.pop("tail", None)
+    return doc
 
-print("Risk classes updated in 'stocks' collection.")
+
+def load_features(db, tickers, workers=None):
+    """Returns {ticker: feature document}, building missing ones from history."""
+    found = {
+        doc["Ticker"]: doc
+        for doc in db[features.COLLECTION].find({"Ticker": {"$in": tickers}}, {"_id": 0, "tail": 0})
+    }
+    missing = [ticker for ticker in tickers if ticker not in found]
+    if missing:
+        if workers and workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                built = list(executor.map(_build_features, missing, chunksize=16))
+        else:
+            built = [_build_features(ticker, db) for ticker in missing]
+        found.update({doc["Ticker"]: doc for doc in built if doc is not None})
+    return found
+
+
+def precompute_risk(db, tickers=None, workers=None):
+    """Scores the given tickers (all of "stocks" by default). Returns (risk classes, stage timings)."""
+    timings = {}
+
+    start = time.perf_counter()
+    if tickers is None:
+        tickers = db["stocks"].distinct("Ticker")
+    feature_docs = load_features(db, tickers, workers=workers)
+    timings["features"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scored = list(feature_docs)
+    classes = dict(zip(scored, risk_service.risk_classes([feature_docs[t] for t in scored])))
+    timings["predict"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if classes:
+        now = datetime.now(timezone.utc)
+        db["stocks"].bulk_write([
+            UpdateOne({"Ticker": ticker}, {"$set": {"risk_class": risk_class, "risk_updated_at": now}})
+            for ticker, risk_class in classes.items()
+        ], ordered=False)
+    timings["write"] = time.perf_counter() - start
+
+    return classes, timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute risk classes for every stock.")
+    parser.add_argument("--workers", type=int, default=1, help="processes for rebuilding missing features")
+    args = parser.parse_args()
+
+    classes, timings = precompute_risk(connection.get_db(), workers=args.workers)
+    for stage, seconds in timings.items():
+        print(f"{stage:>9}: {seconds:.3f}s")
+    print(f"Risk classes updated for {len(classes)} tickers in 'stocks' collection.")
@@ -0,0 +1,146 @@
+from datetime import datetime, timezone
+import mongomock
+import pytest
+import backfill_account_stats
+import main
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient().stock_optimizer
+    monkeypatch.setattr(main.mongo, "db", db)
+    db.stocks.insert_one({"Ticker": "MSFT", "Close": 10.0, "risk": 2, "risk_explanation": "ok"})
+    return db
+
+
+def legacy_user(db):
+    """An account from before trade_stats, with purchases worth 180 of profit."""
+    user_id = db.users.insert_one({"username": "old", "email": "old@example.com", "balance": 1000.0}).inserted_id
+    db.transactions.insert_many([
+        {"user_id": user_id, "ticker": "MSFT", "totalPrice": 120.0, "purchasePrice": 12.0},
+        {"user_id": user_id, "ticker": "MSFT", "totalPrice": 80.0, "purchasePrice": 8.0},
+    ])
+    return user_id
+
+
+def client_for(user_id):
+    client = main.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = str(user_id)
+    return client
+
+
+def buy(client):
+    # Profit of this purchase: 2 * 10 - 10 = 10
+    response = client.post("/api/purchase", json={"ticker": "MSFT", "quantity": 2, "price": 10.0, "confirm": True})
+    assert response.status_code == 200
+
+
+def test_purchase_updates_balance_and_stats_together(db):
+    user_id = db.users.insert_one({
+        "username": "new", "email": "new@example.com", "balance": 100.0,
+        "trade_stats": {"profit": 0.0, "transactions": 0, "backfilled_at": datetime.now(timezone.utc)},
+    }).inserted_id
+    buy(client_for(user_id))
+    user = db.users.find_one({"_id": user_id})
+    assert user["balance"] == 80.0
+    assert user["trade_stats"]["profit"] == 10.0
+    assert user["trade_stats"]["transactions"] == 1
+
+
+def test_backfill_repairs_stats_created_by_a_purchase_before_it(db):
+    user_id = legacy_user(db)
+    client = client_for(user_id)
+    buy(client)  # deployed before the backfill ran: $inc creates partial stats
+
+    assert backfill_account_stats.backfill(db) == 1
+    stats = db.users.find_one({"_id": user_id})["trade_stats"]
+    assert stats["profit"] == 190.0
+    assert stats["transactions"] == 3
+    assert "backfilled_at" in stats
+    assert client.get("/api/account").get_json()["profit"] == 190.0
+    # Backfilled users are not touched again by default
+    assert backfill_account_stats.backfill(db) == 0
+
+
+def test_account_backfills_lazily(db):
+    user_id = legacy_user(db)
+    client = client_for(user_id)
+    buy(client)
+
+    assert client.get("/api/account").get_json()["profit"] == 190.0
+    assert "backfilled_at" in db.users.find_one({"_id": user_id})["trade_stats"]
+    buy(client)
+    assert client.get("/api/account").get_json()["profit"] == 200.0
+
+
+def test_backfill_skips_a_user_whose_counter_moved(db):
+    user_id = legacy_user(db)
+    stale = db.users.find_one({"_id": user_id})
+    # A purchase lands after the user was read
+    db.users.update_one({"_id": user_id}, {"$inc": {"trade_stats.profit": 10.0, "trade_stats.transactions": 1}})
+    backfill_account_stats.backfill_user(db, stale)
+    assert "backfilled_at" not in db.users.find_one({"_id": user_id})["trade_stats"]
+
+
+def test_register_marks_stats_as_complete(db):
+    response = main.app.test_client().post(
+        "/api/register", json={"username": "fresh", "email": "fresh@example.com", "password": "pw"}
+    )
+    assert response.status_code in (200, 201)
+    stats = db.users.find_one({"email": "fresh@example.com"})["trade_stats"]
+    assert stats["transactions"] == 0 and "backfilled_at" in stats
+
+
+def begin_purchase(db, user_id):
+    """First half of purchase(): the transaction is inserted, not yet recorded on the user."""
+    return db.transactions.insert_one(
+        {"user_id": user_id, "ticker": "MSFT", "totalPrice": 20.0, "purchasePrice": 10.0}
+    ).inserted_id
+
+
+def finish_purchase(db, user_id, transaction_id):
+    assert backfill_account_stats.record_purchase(db, user_id, transaction_id, 980.0, 10.0)
+
+
+def backfill_steps(db, user_id):
+    """backfill_user split into its read, its aggregation and its write."""
+    user = db.users.find_one({"_id": user_id})
+    yield
+    stats = backfill_account_stats.account_stats(db, [user_id])[user_id]
+    yield
+    db.users.update_one(*backfill_account_stats._update(user, stats, datetime.now(timezone.utc)))
+    yield
+
+
+def settle(db, user_id):
+    """Whatever the interleaving, /api/account ends at the true profit."""
+    assert client_for(user_id).get("/api/account").get_json()["profit"] == 190.0
+    stats = db.users.find_one({"_id": user_id})["trade_stats"]
+    assert stats["profit"] == 190.0
+    assert stats["transactions"] == 3
+    assert db.users.find_one({"_id": user_id})["balance"] == 980.0
+
+
+@pytest.mark.parametrize("order", [
+    # B: the backfill's read, aggregation and write; P: the purchase's insert and record
+    "B B P B P",   # aggregation misses the purchase, written before it is recorded: added on top
+    "B B P P B",   # aggregation misses the purchase, recorded before the write: write dropped
+    "B P B P B",   # aggregation counts the purchase, recorded before the write: write dropped
+    "B P B B P",   # aggregation counts the purchase, written before it is recorded: not added again
+    "P B B P B",   # read after the insert, recorded before the write: write dropped
+    "B B B P P",   # backfill done before the purchase starts
+    "P P B B B",   # purchase done before the backfill starts
+])
+def test_backfill_racing_a_purchase(db, order):
+    user_id = legacy_user(db)
+    backfill = backfill_steps(db, user_id)
+    transaction_id = None
+    for step in order.split():
+        if step == "B":
+            next(backfill)
+        elif transaction_id is None:
+            transaction_id = begin_purchase(db, user_id)
+        else:
+            finish_purchase(db, user_id, transaction_id)
+    settle(db, user_id)
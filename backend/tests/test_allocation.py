@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import allocation
+import bench_allocation
+
+
+def loop_top_up(prices, quantities, remaining, max_quantities=None):
+    """The one-share-per-stock-per-pass loop top_up replaces."""
+    quantities = list(quantities)
+    improved = True
+    while improved and remaining > 0:
+        improved = False
+        for i, price in enumerate(prices):
+            capped = max_quantities is not None and quantities[i] >= max_quantities[i]
+            if 0 < price <= remaining and not capped:
+                quantities[i] += 1
+                remaining -= price
+                improved = True
+    return quantities, remaining
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("budget", [1e3, 1e5])
+@pytest.mark.parametrize("case", ["narrow", "unaffordable"])
+def test_allocate_matches_greedy_loop(seed, budget, case):
+    stocks = bench_allocation.synthetic_stocks(10, seed=seed)
+    if case == "unaffordable":
+        stocks[0].update(risk_class=0, Close=budget)
+    stocks.sort(key=lambda s: s["risk_class"])
+    expected = bench_allocation.greedy([dict(s) for s in stocks], budget, 3)
+    positions, total_cost, remaining = allocation.allocate([dict(s) for s in stocks], budget, 3)
+    assert {p["Ticker"]: p["recommended_quantity"] for p in positions} == expected
+    assert total_cost + remaining == pytest.approx(budget)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_top_up_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    prices = rng.uniform(1, 50, 8).round(2)
+    prices[0] = 0.0  # a stock without a price never gets shares
+    quantities = rng.integers(0, 5, 8)
+    caps = quantities + rng.integers(0, 20, 8) if seed % 2 else None
+    remaining = float(rng.uniform(0, 2000))
+
+    topped, left = allocation.top_up(prices, quantities, remaining, caps)
+    expected, expected_left = loop_top_up(prices, quantities, remaining, caps)
+    assert list(topped) == expected
+    assert left == pytest.approx(expected_left)
+
+
+def test_cap_weights_redistributes_excess():
+    weights = allocation.cap_weights([0.7, 0.2, 0.1], 0.5)
+    assert weights.max() <= 0.5 + 1e-12
+    assert weights.sum() == pytest.approx(1.0)
+    # The excess goes to the uncapped stocks in proportion to their weights
+    assert weights[1] / weights[2] == pytest.approx(2.0)
+
+
+def test_cap_weights_keeps_cash_when_cap_is_too_low():
+    weights = allocation.cap_weights([0.5, 0.3, 0.2], 0.2)
+    assert np.allclose(weights, 0.2)
+
+
+def test_whole_shares_stays_within_budget_and_caps():
+    rng = np.random.default_rng(0)
+    prices = rng.uniform(5, 500, 50)
+    weights = rng.dirichlet(np.ones(50))
+    weights[3] = 0.0
+    weights /= weights.sum()
+    caps = np.full(50, 5.0)
+    shares = allocation._whole_shares(weights, prices, 20000.0, caps)
+    assert (shares * prices).sum() <= 20000.0
+    assert (shares <= caps).all()
+    assert shares[3] == 0
+    assert (shares >= np.minimum(np.floor(weights * 20000.0 / prices), caps)).all()
+
+
+def test_rebalance_never_overspends():
+    rng = np.random.default_rng(1)
+    prices = rng.uniform(5, 500, 100)
+    shares = rng.integers(0, 200, 100)
+    weights = rng.dirichlet(np.ones(100))
+    result = allocation.rebalance(prices, shares, weights, cash=1000.0, max_weight=0.05)
+    assert result["cash_left"] >= -1e-6
+    assert (result["target"] >= 0).all()
+    assert (result["target"] * prices <= 0.05 * result["value"] + 1e-6).all()
+    assert np.array_equal(result["trade"], result["target"] - shares)
+    assert result["expected_cost"] == pytest.approx(result["turnover"] * allocation.TRADE_COST_BPS / 10000)
+
+
+def test_rebalance_band_and_unpriced_positions_keep_their_shares():
+    prices = np.array([100.0, 50.0, 0.0])
+    shares = np.array([10, 20, 7])
+    # The first position already sits at its target; the unpriced one cannot trade
+    result = allocation.rebalance(prices, shares, [0.5, 0.5, 0.0], band=0.01)
+    assert result["target"][0] == 10
+    assert result["target"][2] == 7
+    assert result["trade"][2] == 0
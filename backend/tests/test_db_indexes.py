@@ -0,0 +1,55 @@
+import mongomock
+import db_indexes
+
+
+def test_ensure_indexes_creates_every_index():
+    db = mongomock.MongoClient().stock_optimizer
+    created, failed = db_indexes.ensure_indexes(db)
+    assert failed == []
+    assert len(created) == sum(len(indexes) for indexes in db_indexes.INDEXES.values())
+    assert "email" in db.users.index_information()
+
+
+def test_ensure_indexes_is_idempotent():
+    db = mongomock.MongoClient().stock_optimizer
+    db_indexes.ensure_indexes(db)
+    created, failed = db_indexes.ensure_indexes(db)
+    assert failed == []
+    assert "users.email" in created
+
+
+def test_duplicate_emails_do_not_stop_the_other_indexes():
+    db = mongomock.MongoClient().stock_optimizer
+    db.users.insert_many([{"email": "a@example.com"}, {"email": "a@example.com"}])
+    created, failed = db_indexes.ensure_indexes(db)
+
+    assert [name for name, _ in failed] == ["users.email"]
+    assert "duplicate email" in failed[0][1]
+    # Collections declared after users still get their indexes
+    assert "stock_features.ticker" in created
+    assert "tickers" in db.portfolio_summaries.index_information()
+
+
+def test_plan_stages_walks_nested_plans():
+    plan = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "FETCH",
+                "inputStage": {
+                    "stage": "OR",
+                    "inputStages": [
+                        {"stage": "IXSCAN", "indexName": "ticker"},
+                        {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+                    ],
+                },
+            }
+        }
+    }
+    stages = list(db_indexes._plan_stages(plan["queryPlanner"]["winningPlan"]))
+    assert stages == ["FETCH", "OR", "IXSCAN", "SORT", "COLLSCAN"]
+
+
+def test_plan_stages_unwraps_query_plan():
+    # Slot-based engine plans nest the classic tree under queryPlan
+    plan = {"queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}
+    assert list(db_indexes._plan_stages(plan)) == ["FETCH", "IXSCAN"]
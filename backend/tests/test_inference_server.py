@@ -0,0 +1,34 @@
+import threading
+import time
+from multiprocessing.connection import Listener
+import pytest
+from modelAI import inference_server
+
+
+def test_client_and_server_require_an_authkey(monkeypatch):
+    monkeypatch.delenv("INFERENCE_AUTHKEY", raising=False)
+    with pytest.raises(RuntimeError, match="INFERENCE_AUTHKEY"):
+        inference_server.InferenceClient("127.0.0.1:6001")
+    with pytest.raises(RuntimeError, match="INFERENCE_AUTHKEY"):
+        inference_server.InferenceServer("127.0.0.1:6001")
+
+
+def test_call_times_out_and_drops_the_connection(monkeypatch):
+    monkeypatch.setenv("INFERENCE_AUTHKEY", "test-secret")
+    listener = Listener(("127.0.0.1", 0), authkey=b"test-secret")
+    accepted = []
+
+    def accept_and_hang():
+        conn = listener.accept()
+        accepted.append(conn)
+        conn.recv()  # read the request, never answer
+
+    threading.Thread(target=accept_and_hang, daemon=True).start()
+    host, port = listener.address
+    client = inference_server.InferenceClient(f"{host}:{port}", timeout=0.2)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.versions()
+    assert time.monotonic() - start < 2
+    assert client._local.conn is None
+    listener.close()
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pytest
+from modelAI import lstm_runtime
+
+RUNTIMES = {"tflite": ("tflite_runtime", "tensorflow"), "onnx": ("onnxruntime",)}
+
+
+def _require_any(modules):
+    for module in modules:
+        try:
+            __import__(module)
+            return
+        except ImportError:
+            continue
+    pytest.skip(f"no runtime installed ({' or '.join(modules)})")
+
+
+@pytest.mark.parametrize("backend", sorted(lstm_runtime.EXPORT_FILES))
+def test_export_matches_keras(backend):
+    path = os.path.join(lstm_runtime.MODEL_DIR, lstm_runtime.EXPORT_FILES[backend])
+    if not os.path.exists(path):
+        pytest.skip(f"{backend} export missing (python -m modelAI.lstm_runtime --format {backend})")
+    _require_any(RUNTIMES[backend])
+    pytest.importorskip("tensorflow")
+    import bench_lstm_backends
+    from modelAI.registry import load_keras
+
+    keras_model = load_keras(os.path.join(lstm_runtime.MODEL_DIR, lstm_runtime.KERAS_FILE))
+    exported = bench_lstm_backends.LOADERS[backend](path)
+    windows = bench_lstm_backends.sample_windows(16)
+    reference = np.asarray(keras_model.predict(windows, batch_size=len(windows), verbose=0)).reshape(-1)
+    assert np.abs(np.asarray(exported.predict(windows)).reshape(-1) - reference).max() <= 1e-4
+
+
+@pytest.mark.parametrize("backend", sorted(lstm_runtime.EXPORT_FILES))
+def test_batch_sizes_are_consistent(backend):
+    # Resizing the input between calls must not change a window's prediction
+    path = os.path.join(lstm_runtime.MODEL_DIR, lstm_runtime.EXPORT_FILES[backend])
+    if not os.path.exists(path):
+        pytest.skip(f"{backend} export missing")
+    _require_any(RUNTIMES[backend])
+    import bench_lstm_backends
+
+    model = bench_lstm_backends.LOADERS[backend](path)
+    windows = bench_lstm_backends.sample_windows(4)
+    batched = np.asarray(model.predict(windows)).reshape(-1)
+    single = np.concatenate([np.asarray(model.predict(w[None])).reshape(-1) for w in windows])
+    assert np.allclose(batched, single, atol=1e-5)
@@ -0,0 +1,34 @@
+import mongomock
+import pytest
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = mongomock.MongoClient().stock_optimizer
+    monkeypatch.setattr(main.mongo, "db", db)
+    user_id = db.users.insert_one({"username": "u", "email": "u@example.com"}).inserted_id
+    db.stocks.insert_many([
+        {"Ticker": "AAA", "Close": 100.0, "risk_class": 1, "sector": "Technology"},
+        {"Ticker": "BBB", "Close": 50.0, "risk_class": 2, "sector": "Technology"},
+    ])
+    db.portfolios.insert_many([
+        {"user_id": user_id, "ticker": "AAA", "quantity": 20, "average_cost": 90.0},
+        {"user_id": user_id, "ticker": "BBB", "quantity": 20, "average_cost": 40.0},
+    ])
+    client = main.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = str(user_id)
+    return client
+
+
+@pytest.mark.parametrize("cash", [-5000, "nan", "x"])
+def test_invalid_cash_is_rejected(client, cash):
+    response = client.post("/api/rebalance", json={"cash": cash})
+    assert response.status_code == 400
+
+
+def test_rebalance_with_cash_never_overspends(client):
+    response = client.post("/api/rebalance", json={"cash": 500, "constraints": {"method": "risk"}})
+    assert response.status_code == 200
+    assert response.get_json()["cash_left"] >= 0
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+import mongomock
+import numpy as np
+import pandas as pd
+import returns_panel
+
+
+def _load_history(db, tickers, days, start=datetime(2020, 1, 1), seed=0):
+    rng = np.random.default_rng(seed)
+    docs = []
+    for ticker in tickers:
+        close = 100.0
+        for day in range(days):
+            date = start + timedelta(days=day)
+            if date.weekday() >= 5:
+                continue
+            close *= 1 + rng.normal(0, 0.01)
+            docs.append({"Ticker": ticker, "Date": date, "Close": close, "Volume": 1})
+    db.historical_stocks.insert_many(docs)
+
+
+def test_build_covers_only_the_lookback(tmp_path):
+    db = mongomock.MongoClient().stock_optimizer
+    _load_history(db, ["AAA", "BBB", "CCC"], days=800)
+    panel = returns_panel.Panel(returns_panel.build(db, lookback=60, panel_dir=str(tmp_path)))
+
+    assert panel.tickers == ["AAA", "BBB", "CCC"]
+    assert panel.returns.shape == (3, 60)
+
+    # Same returns and moments as a full-history pivot, cut to the window
+    bars = pd.DataFrame(list(db.historical_stocks.find({}, {"_id": 0})))
+    closes = bars.pivot_table(index="Ticker", columns="Date", values="Close").sort_index(axis=1).to_numpy()
+    expected = (closes[:, 1:] / closes[:, :-1] - 1)[:, -60:]
+    assert np.allclose(panel.returns, expected, atol=1e-6)
+    assert panel.dates[-1] == bars["Date"].max().isoformat()
+    mean, cov = returns_panel.compute_moments(expected.astype(np.float32), 60)
+    assert np.allclose(panel.mean, mean)
+    assert np.allclose(panel.cov, cov)
+
+
+def test_tickers_without_bars_in_the_window_are_left_out(tmp_path):
+    db = mongomock.MongoClient().stock_optimizer
+    _load_history(db, ["AAA", "BBB"], days=400, start=datetime(2021, 1, 1))
+    _load_history(db, ["OLD"], days=100, start=datetime(2019, 1, 1))
+    panel = returns_panel.Panel(returns_panel.build(db, lookback=30, panel_dir=str(tmp_path)))
+    assert panel.tickers == ["AAA", "BBB"]
@@ -0,0 +1,21 @@
+from datetime import datetime, timedelta
+import mongomock
+import risk_precompute
+from modelAI import connection
+
+
+def test_missing_features_are_built_from_the_given_db(monkeypatch):
+    db = mongomock.MongoClient().stock_optimizer
+    start = datetime(2024, 1, 1)
+    db.historical_stocks.insert_many([
+        {"Ticker": "AAA", "Date": start + timedelta(days=d), "Close_norm": 0.1 + d / 1000, "Volume": 1000 + d}
+        for d in range(30)
+    ])
+
+    def other_db():
+        raise AssertionError("the in-process path must not open its own connection")
+
+    monkeypatch.setattr(connection, "get_db", other_db)
+    found = risk_precompute.load_features(db, ["AAA", "NONE"])
+    assert list(found) == ["AAA"]
+    assert db.stock_features.find_one({"Ticker": "AAA"}) is not None
@@ -0,0 +1,30 @@
+import os
+import threading
+import bench_import
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_stays_light(monkeypatch):
+    # Fresh interpreter: importing the app must not load TensorFlow or do start-up work
+    monkeypatch.chdir(BACKEND)
+    run = bench_import.measure()
+    assert not run["tensorflow"]
+    assert run["seconds"] < bench_import.BUDGET
+
+
+def test_first_request_warms_up_once(monkeypatch):
+    import main
+    calls = []
+    monkeypatch.setattr(main, "_warmed_up", False)
+    monkeypatch.setattr(main, "_ensure_indexes", lambda: calls.append("indexes"))
+    monkeypatch.setattr(main.api, "warm_up", lambda: calls.append("models"))
+
+    client = main.app.test_client()
+    client.get("/api/model/")
+    client.get("/api/model/")
+    main.warm_up()
+    for thread in threading.enumerate():
+        if thread.name == "ensure-indexes":
+            thread.join()
+    assert sorted(calls) == ["indexes", "models"]
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+import mongomock
+import numpy as np
+import pytest
+import worker
+from modelAI import forecast_cache, forecast_service, risk_service
+
+TICKERS = ["AAA", "BBB"]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient().stock_optimizer
+    start = datetime(2020, 1, 1)
+    rng = np.random.default_rng(0)
+    for ticker in TICKERS:
+        closes = np.clip(0.3 + np.cumsum(rng.normal(0, 0.002, forecast_service.WINDOW + 30)), 0, 1)
+        db.historical_stocks.insert_many([
+            {"Ticker": ticker, "Date": start + timedelta(days=d), "Close_norm": float(c), "Volume": 1000}
+            for d, c in enumerate(closes)
+        ])
+    db.stocks.insert_many([
+        {"Ticker": t, "needs_refresh": True, "refresh_requested_at": datetime.now(timezone.utc) - timedelta(minutes=1)}
+        for t in TICKERS
+    ])
+    forecast_cache.cache.invalidate()
+    monkeypatch.setattr(forecast_service.models, "version", lambda name: "test")
+    monkeypatch.setattr(risk_service, "risk_classes", lambda docs: [2] * len(docs))
+    return db
+
+
+def flags(db):
+    return {doc["Ticker"]: doc["needs_refresh"] for doc in db.stocks.find()}
+
+
+def test_failed_model_call_keeps_every_flag(db, monkeypatch):
+    def fail(windows):
+        raise RuntimeError("inference server unreachable")
+
+    monkeypatch.setattr(forecast_service, "predict_windows", fail)
+    assert worker.refresh_pending(db) == 0
+    assert flags(db) == {"AAA": True, "BBB": True}
+    assert db.forecasts.count_documents({}) == 0
+
+
+def test_successful_refresh_clears_flags(db, monkeypatch):
+    monkeypatch.setattr(forecast_service, "predict_windows", lambda windows: [0.5] * len(windows))
+    assert worker.refresh_pending(db) == 2
+    assert flags(db) == {"AAA": False, "BBB": False}
+    assert db.forecasts.count_documents({}) == 2
+
+
+def test_only_forecast_tickers_are_cleared(db, monkeypatch):
+    monkeypatch.setattr(forecast_service, "predict_windows", lambda windows: [0.5] * len(windows))
+    db.historical_stocks.delete_many({"Ticker": "BBB"})
+    assert worker.refresh_pending(db) == 1
+    assert flags(db) == {"AAA": False, "BBB": True}
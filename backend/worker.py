@@ -0,0 +1,91 @@
+# worker.py
+"""
+Background recompute worker, run as its own process next to the web app:
+
+    python worker.py [--interval 60] [--once]
+
+Every interval it picks up the stocks flagged with needs_refresh by
+market_data_extraction (full loads flag every ticker, appends flag the
+tickers that got new bars), recomputes their forecasts in one batch and
+their risk classes in one model call, stores the results with timestamps
+in the forecasts collection and on the stocks documents, then clears the
+flags of the tickers that got both. A failed forecast leaves its flag set,
+so the ticker is retried on the next pass. The routes only read these
+precomputed values.
+"""
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timezone
+from modelAI import connection, forecast_service
+import portfolio_summary
+from risk_precompute import precompute_risk
+
+logging.basicConfig(level=logging.INFO)
+
+
+def refresh(db, tickers):
+    """
+    Recomputes forecasts and risk classes for the given tickers. Returns the
+    tickers whose forecast was stored and whose risk class was updated.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    results = forecast_service.forecast_tickers(tickers, db=db)
+    forecast_service.store_forecasts(db, results)
+    timings["forecasts"] = time.perf_counter() - start
+
+    # Portfolio valuations holding these tickers used the old forecasts
+    portfolio_summary.invalidate(db, tickers)
+
+    classes, risk_timings = precompute_risk(db, tickers)
+    timings["risk"] = sum(risk_timings.values())
+
+    refreshed = [t for t in tickers if "error" not in results.get(t, {"error": None}) and t in classes]
+    logging.info(f"Refreshed {len(refreshed)}/{len(tickers)} forecasts and risk classes: "
+                 + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+    return refreshed
+
+
+def refresh_pending(db):
+    """
+    Refreshes every flagged ticker and returns how many were refreshed. Only
+    those have their flag cleared; flags of failed tickers, and flags raised
+    while this runs, stay set for the next pass.
+    """
+    started_at = datetime.now(timezone.utc)
+    tickers = db["stocks"].distinct("Ticker", {"needs_refresh": True})
+    if not tickers:
+        return 0
+    refreshed = refresh(db, tickers)
+    if refreshed:
+        db["stocks"].update_many(
+            {"Ticker": {"$in": refreshed}, "needs_refresh": True, "refresh_requested_at": {"$lte": started_at}},
+            {"$set": {"needs_refresh": False, "refreshed_at": datetime.now(timezone.utc)}}
+        )
+    return len(refreshed)
+
+
+async def run(interval):
+    db = connection.get_db()
+    while True:
+        try:
+            # Model calls block, so they run off the event loop
+            await asyncio.to_thread(refresh_pending, db)
+        except Exception as e:
+            logging.error(f"Refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute forecasts and risk classes after data updates.")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between checks for flagged stocks")
+    parser.add_argument("--once", action="store_true", help="refresh flagged stocks once and exit")
+    args = parser.parse_args()
+
+    if args.once:
+        print(f"Refreshed {refresh_pending(connection.get_db())} tickers.")
+    else:
+        asyncio.run(run(args.interval))